@@ -1,29 +1,380 @@
 """Flask application for AI service"""
-from flask import Flask, request, jsonify
-from app.services.recommendation_engine import RecommendationEngine
-from app.services.digital_twin import DigitalTwinService
-from app.utils import get_flask_config
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+from app.services.admission import (
+    AdmissionController,
+    Overloaded,
+    PRIORITY_NAMES,
+    PRIORITY_RECOMMENDATIONS,
+    PRIORITY_TWIN,
+    retry_after_header,
+)
+from app.services.registry import LazyService, ServiceUnavailableError, warm_up
+from app.utils import (
+    get_admin_token,
+    get_admission_config,
+    get_capture_config,
+    get_flask_config,
+    get_flight_recorder_config,
+    get_gemini_api_key,
+    get_max_request_bytes,
+    get_segment_profiles_path,
+    get_segment_warm_count,
+    get_similarity_index_dir,
+    get_warm_services,
+)
+from app.utils import capture
+from app.utils.profiler import ProfilerBusy, SamplingProfiler
+from app.utils.tracing import FlightRecorder, end_trace, span, start_trace
+from app.utils.validation import (
+    ValidationError,
+    validate,
+    RECOMMENDATION_REQUEST_SCHEMA,
+    TWIN_MESSAGE_REQUEST_SCHEMA,
+    SIMILAR_CONTENT_REQUEST_SCHEMA,
+)
+import hmac
 import logging
+from functools import partial
+from typing import Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Flask app
-app = Flask(__name__)
 
-# Initialize services
-recommendation_engine = RecommendationEngine()
-digital_twin_service = DigitalTwinService()
+# Services are built on first use so that importing this module stays cheap:
+# google.generativeai and numpy are only imported inside the factories.
+def _build_similarity_index():
+    index_dir = get_similarity_index_dir()
+    if not index_dir:
+        return None
+    from app.services.similarity_index import SimilarityIndex
+    return SimilarityIndex(index_dir)
 
 
-@app.route('/health', methods=['GET'])
+def _build_recommendation_engine():
+    from app.services.recommendation_engine import RecommendationEngine
+    engine = RecommendationEngine()
+    if traffic_capture is not None:
+        capture.replace_models(engine, capture.RecordingModel)
+    return engine
+
+
+def _build_digital_twin_service():
+    from app.services.digital_twin import DigitalTwinService
+    service = DigitalTwinService(similarity_index=similarity_index.get())
+    if traffic_capture is not None:
+        capture.replace_models(service, capture.RecordingModel)
+    return service
+
+
+def _warm_segment_cache():
+    """Precompute cold-start results for the most common preference segments"""
+    from app.utils.exports import load_records
+    profiles = load_records(get_segment_profiles_path())
+    generated = recommendation_engine.get().warm_segment_cache(
+        profiles,
+        top_n=get_segment_warm_count()
+    )
+    logger.info(f"Warmed {generated} cold-start segments from {len(profiles)} profiles")
+
+
+similarity_index = LazyService('similarity_index', _build_similarity_index)
+recommendation_engine = LazyService('recommendation_engine', _build_recommendation_engine)
+digital_twin_service = LazyService('digital_twin', _build_digital_twin_service)
+
+SERVICES = (similarity_index, recommendation_engine, digital_twin_service)
+
+# Bounded, prioritized access to the LLM-backed services
+admission_config = get_admission_config()
+admission = AdmissionController(
+    max_concurrent=admission_config['max_concurrent'],
+    max_queue=admission_config['max_queue']
+)
+
+# /admin endpoints expose internals and can hold a worker for a minute, so they are opt-in
+admin_token = get_admin_token()
+
+# Span trees of recent API requests, and an on-demand stack sampler
+flight_recorder = FlightRecorder(**get_flight_recorder_config())
+profiler = SamplingProfiler()
+
+# Opt-in sampling of LLM-backed traffic for offline replay (see app/services/replay.py)
+capture_config = get_capture_config()
+traffic_capture = capture.TrafficCapture(**capture_config) if capture_config['directory'] else None
+CAPTURED_PATHS = {
+    '/ai/recommendations': 'recommendations',
+    '/ai/twin/message': 'twin',
+}
+
+bp = Blueprint('ai', __name__)
+
+
+@bp.before_app_request
+def start_request_trace():
+    """Open the root span for API requests (health and admin calls aren't traced)"""
+    if request.path.startswith('/ai/'):
+        g.trace = start_trace(request.path)
+    return None
+
+
+@bp.after_app_request
+def finish_request_trace(response):
+    # Registered first, so it runs after the other after-request hooks
+    root = g.pop('trace', None)
+    if root is not None:
+        end_trace(root)
+        flight_recorder.record(root, method=request.method, path=request.path, status=response.status_code)
+    return response
+
+
+@bp.teardown_app_request
+def clear_request_trace(error=None):
+    end_trace(None)
+
+
+@bp.before_app_request
+def check_admin_access():
+    """Hide admin endpoints unless ADMIN_TOKEN is set, and require it in X-Admin-Token"""
+    if not request.path.startswith('/admin/'):
+        return None
+    if admin_token is None:
+        return jsonify({'error': 'Endpoint not found'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), admin_token.encode()):
+        return jsonify({'error': 'Invalid or missing X-Admin-Token'}), 403
+    return None
+
+
+@bp.before_app_request
+def enforce_body_size():
+    """Reject oversized bodies before any parsing or service work"""
+    if request.method != 'POST':
+        return None
+    
+    limit = current_app.config['MAX_CONTENT_LENGTH']
+    if request.content_length is not None and request.content_length > limit:
+        return _payload_too_large(limit)
+    
+    try:
+        # Chunked bodies are read through Werkzeug's capped stream, which stops at the limit
+        body = request.get_data(cache=True)
+    except RequestEntityTooLarge:
+        return _payload_too_large(limit)
+    if request.content_length is None and len(body) >= limit:
+        return _payload_too_large(limit)
+    return None
+
+
+@bp.before_app_request
+def start_capture():
+    """Start recording a sampled request (after the body size check)"""
+    if traffic_capture is None or request.method != 'POST' or request.path not in CAPTURED_PATHS:
+        return None
+    record = traffic_capture.start(CAPTURED_PATHS[request.path], request.get_json(silent=True))
+    if record is not None:
+        g.capture_record = record
+        capture.activate(record)
+    return None
+
+
+@bp.after_app_request
+def finish_capture(response):
+    record = g.pop('capture_record', None)
+    if record is not None:
+        record.finish()
+        if 'trace' in g:
+            record.timings = g.trace.totals()
+        record.status = response.status_code
+        record.response = response.get_json(silent=True)
+        traffic_capture.write(record)
+    return response
+
+
+@bp.teardown_app_request
+def clear_capture(error=None):
+    if traffic_capture is not None:
+        capture.activate(None)
+
+
+def _payload_too_large(limit: int):
+    return jsonify({'error': f'Request body must be {limit} bytes or less'}), 413
+
+
+def _validated_json(schema: dict) -> dict:
+    """Decode the request body and validate it against a schema"""
+    with span('validation'):
+        data = None
+        if request.get_data(cache=True).strip():
+            if not request.is_json:
+                raise ValidationError([{'field': '', 'message': 'Request body must be sent as application/json'}])
+            try:
+                data = request.get_json()
+            except BadRequest:
+                raise ValidationError([{'field': '', 'message': 'Request body must be valid JSON'}])
+        validate(data, schema)
+    return data
+
+
+def _validation_error(error: ValidationError):
+    return jsonify({'error': str(error), 'errors': error.errors}), 400
+
+
+def _request_priority(default: int) -> int:
+    """Endpoint priority, optionally lowered (never raised) via X-Request-Priority"""
+    requested = PRIORITY_NAMES.get(request.headers.get('X-Request-Priority', '').lower())
+    return max(default, requested) if requested is not None else default
+
+
+def _request_budget() -> float:
+    """Seconds the caller will wait, from X-Request-Budget-Ms or the configured default"""
+    try:
+        budget_ms = int(request.headers.get('X-Request-Budget-Ms', admission_config['default_budget_ms']))
+    except ValueError:
+        budget_ms = admission_config['default_budget_ms']
+    return max(budget_ms, 0) / 1000
+
+
+def _overloaded(error: Overloaded):
+    response = jsonify({'error': 'Service overloaded, retry later', 'reason': error.reason})
+    response.headers['Retry-After'] = retry_after_header(error)
+    return response, 503
+
+
+def _service_unavailable(error: ServiceUnavailableError):
+    logger.error(str(error))
+    return jsonify({'error': 'Service unavailable', 'details': str(error)}), 503
+
+
+@bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'service': 'ghostypedia-ai'}), 200
 
 
-@app.route('/ai/recommendations', methods=['POST'])
+@bp.route('/health/live', methods=['GET'])
+def liveness_check():
+    """Liveness: the process is up and serving requests; no dependencies checked"""
+    return jsonify({'status': 'alive', 'service': 'ghostypedia-ai'}), 200
+
+
+@bp.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness: configuration needed to serve traffic is present
+
+    With WARM_SERVICES on, also waits until warm-up has built (or failed to
+    build) every service, so the first requests don't pay for construction.
+    Otherwise services are built lazily and their state is only reported.
+    """
+    checks = {}
+    try:
+        get_gemini_api_key()
+        checks['gemini_api_key'] = 'ok'
+    except ValueError as e:
+        checks['gemini_api_key'] = str(e)
+    
+    services = {service.name: service.status() for service in SERVICES}
+    if current_app.config.get('WARM_SERVICES'):
+        pending = [name for name, status in services.items() if status['state'] == 'pending']
+        checks['warm_up'] = f"pending: {', '.join(pending)}" if pending else 'ok'
+    
+    ready = all(result == 'ok' for result in checks.values())
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'checks': checks,
+        'services': services
+    }), 200 if ready else 503
+
+
+@bp.route('/admin/admission', methods=['GET'])
+def admission_stats():
+    """Queue depth, in-flight requests and shed counts for the LLM-backed endpoints"""
+    return jsonify(admission.stats()), 200
+
+
+@bp.route('/admin/twin/routing', methods=['GET'])
+def twin_routing_stats():
+    """Digital twin routing decisions and per-tier latency"""
+    if not digital_twin_service.is_initialized:
+        return jsonify({'requests_by_tier': {}, 'requests_by_intent': {}, 'latency_ms': {}}), 200
+    return jsonify(digital_twin_service.get().routing_stats.snapshot()), 200
+
+
+@bp.route('/admin/cache', methods=['GET'])
+def cache_stats():
+    """Hit counts and sizes of the memory and disk cache tiers for built services"""
+    stats = {}
+    if recommendation_engine.is_initialized:
+        engine = recommendation_engine.get()
+        stats['recommendations'] = engine.cache.stats()
+        stats['segments'] = engine.segment_cache.stats()
+    if digital_twin_service.is_initialized:
+        stats['twin_responses'] = digital_twin_service.get().response_cache.stats()
+    return jsonify(stats), 200
+
+
+@bp.route('/admin/offload', methods=['GET'])
+def offload_stats():
+    """Execution backend for CPU-bound recommendation stages and how often each stage was offloaded"""
+    if not recommendation_engine.is_initialized:
+        return jsonify({'backend': None, 'runs': {}}), 200
+    return jsonify(recommendation_engine.get().offload.stats()), 200
+
+
+@bp.route('/admin/batching', methods=['GET'])
+def batching_stats():
+    """How many personalized recommendation requests shared a model call"""
+    if not recommendation_engine.is_initialized or recommendation_engine.get().batcher is None:
+        return jsonify({'enabled': False}), 200
+    return jsonify(dict(recommendation_engine.get().batcher.stats(), enabled=True)), 200
+
+
+@bp.route('/admin/flight-recorder', methods=['GET'])
+def flight_recorder_snapshot():
+    """
+    Span trees of recent requests, newest first
+    
+    Query parameters:
+        slow: 1 to list only requests over SLOW_REQUEST_MS
+        limit: Number of requests (default 50)
+    """
+    slow_only = request.args.get('slow', '0').lower() in ('1', 'true', 'yes')
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(flight_recorder.snapshot(slow_only=slow_only, limit=max(limit, 0))), 200
+
+
+@bp.route('/admin/profile', methods=['POST'])
+def sample_profile():
+    """
+    Sample thread stacks for a few seconds and return collapsed stacks
+    
+    The output can be fed to flamegraph.pl or opened in speedscope.
+    
+    Query parameters:
+        seconds: Sampling duration (default 10, at most 60)
+        interval_ms: Time between samples (default 5)
+        idle: 1 to keep threads parked in waits and sleeps
+    """
+    seconds = request.args.get('seconds', 10, type=float)
+    interval_ms = request.args.get('interval_ms', 5, type=float)
+    if not 0 < seconds <= profiler.max_seconds or not 1 <= interval_ms <= 1000:
+        return jsonify({
+            'error': f'seconds must be between 0 and {profiler.max_seconds:g}, interval_ms between 1 and 1000'
+        }), 400
+    
+    try:
+        stacks = profiler.profile(
+            seconds,
+            interval=interval_ms / 1000,
+            include_idle=request.args.get('idle', '0').lower() in ('1', 'true', 'yes')
+        )
+    except ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return Response(stacks + '\n', mimetype='text/plain'), 200
+
+
+@bp.route('/ai/recommendations', methods=['POST'])
 def generate_recommendations():
     """
     Generate personalized recommendations
@@ -50,37 +401,37 @@ def generate_recommendations():
     """
     try:
         # Validate request
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'Request body is required'}), 400
-        
-        user_id = data.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'user_id is required'}), 400
+        data = _validated_json(RECOMMENDATION_REQUEST_SCHEMA)
         
-        preference_profile = data.get('preference_profile', {})
-        interaction_history = data.get('interaction_history', [])
+        user_id = data['user_id']
+        preference_profile = data.get('preference_profile') or {}
+        interaction_history = data.get('interaction_history') or []
         limit = data.get('limit', 10)
         
-        # Validate limit
-        if not isinstance(limit, int) or limit < 1 or limit > 50:
-            return jsonify({'error': 'limit must be between 1 and 50'}), 400
-        
-        # Generate recommendations
+        # Generate recommendations; cache hits never wait for an admission slot
         logger.info(f"Generating recommendations for user {user_id}")
-        recommendations = recommendation_engine.generate_recommendations(
+        recommendations = recommendation_engine.get().generate_recommendations(
             user_id=user_id,
             preference_profile=preference_profile,
             interaction_history=interaction_history,
-            limit=limit
+            limit=limit,
+            admit=partial(admission.admit, 'recommendations', _request_priority(PRIORITY_RECOMMENDATIONS), _request_budget())
         )
         
-        return jsonify({
-            'user_id': user_id,
-            'recommendations': recommendations,
-            'count': len(recommendations)
-        }), 200
+        with span('serialize'):
+            response = jsonify({
+                'user_id': user_id,
+                'recommendations': recommendations,
+                'count': len(recommendations)
+            })
+        return response, 200
     
+    except ValidationError as e:
+        return _validation_error(e)
+    except ServiceUnavailableError as e:
+        return _service_unavailable(e)
+    except Overloaded as e:
+        return _overloaded(e)
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         return jsonify({'error': str(e)}), 400
@@ -92,7 +443,7 @@ def generate_recommendations():
         }), 500
 
 
-@app.route('/ai/twin/message', methods=['POST'])
+@bp.route('/ai/twin/message', methods=['POST'])
 def digital_twin_message():
     """
     Send a message to the digital twin
@@ -125,49 +476,46 @@ def digital_twin_message():
     """
     try:
         # Validate request
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'Request body is required'}), 400
+        data = _validated_json(TWIN_MESSAGE_REQUEST_SCHEMA)
         
-        user_id = data.get('user_id')
-        message = data.get('message')
+        user_id = data['user_id']
+        message = data['message']
+        context = data.get('context') or {}
         
-        if not user_id:
-            return jsonify({'error': 'user_id is required'}), 400
-        if not message:
-            return jsonify({'error': 'message is required'}), 400
-        
-        # Validate message length
-        if len(message) > 1000:
-            return jsonify({'error': 'message must be 1000 characters or less'}), 400
-        
-        context = data.get('context', {})
-        
-        # Generate response
+        # Generate response; template replies and cache hits never wait for an admission slot
         logger.info(f"Generating digital twin response for user {user_id}")
-        result = digital_twin_service.generate_response(
+        result = digital_twin_service.get().generate_response(
             user_id=user_id,
             message=message,
-            context=context
+            context=context,
+            admit=partial(admission.admit, 'twin', _request_priority(PRIORITY_TWIN), _request_budget())
         )
         
-        if result['success']:
-            return jsonify({
-                'user_id': user_id,
-                'response': result['response'],
-                'content_references': result['content_references'],
-                'response_time': result['response_time']
-            }), 200
-        else:
-            # Return error response but with 200 status for graceful degradation
-            return jsonify({
-                'user_id': user_id,
-                'response': result['response'],
-                'content_references': [],
-                'response_time': result['response_time'],
-                'error': result.get('error')
-            }), 200
+        with span('serialize'):
+            if result['success']:
+                response = jsonify({
+                    'user_id': user_id,
+                    'response': result['response'],
+                    'content_references': result['content_references'],
+                    'response_time': result['response_time']
+                })
+            else:
+                # Return error response but with 200 status for graceful degradation
+                response = jsonify({
+                    'user_id': user_id,
+                    'response': result['response'],
+                    'content_references': [],
+                    'response_time': result['response_time'],
+                    'error': result.get('error')
+                })
+        return response, 200
     
+    except ValidationError as e:
+        return _validation_error(e)
+    except ServiceUnavailableError as e:
+        return _service_unavailable(e)
+    except Overloaded as e:
+        return _overloaded(e)
     except ValueError as e:
         logger.error(f"Validation error: {str(e)}")
         return jsonify({'error': str(e)}), 400
@@ -179,19 +527,100 @@ def digital_twin_message():
         }), 500
 
 
-@app.errorhandler(404)
+@bp.route('/ai/similar', methods=['POST'])
+def similar_content():
+    """
+    Find catalog content similar to an item or to free text
+    
+    Request body:
+    {
+        "content_id": "string" (or "text": "string"),
+        "limit": int (optional, default 10),
+        "approximate": bool (optional, default false)
+    }
+    """
+    try:
+        index = similarity_index.get()
+        if index is None or not index.is_loaded:
+            return jsonify({'error': 'Similarity index is not available'}), 503
+        
+        data = _validated_json(SIMILAR_CONTENT_REQUEST_SCHEMA)
+        
+        content_id = data.get('content_id')
+        text = data.get('text')
+        if not content_id and not text:
+            return jsonify({'error': 'content_id or text is required'}), 400
+        
+        limit = data.get('limit', 10)
+        approximate = data.get('approximate', False)
+        
+        if content_id:
+            items = index.similar_to_item(content_id, k=limit, approximate=approximate)
+        else:
+            items = index.similar_to_text(text, k=limit, approximate=approximate)
+        
+        return jsonify({
+            'items': items,
+            'count': len(items),
+            'index_version': index.version
+        }), 200
+    
+    except ValidationError as e:
+        return _validation_error(e)
+    except ServiceUnavailableError as e:
+        return _service_unavailable(e)
+    except Exception as e:
+        logger.error(f"Error finding similar content: {str(e)}")
+        return jsonify({
+            'error': 'Failed to find similar content',
+            'details': str(e)
+        }), 500
+
+
+@bp.app_errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
     return jsonify({'error': 'Endpoint not found'}), 404
 
 
-@app.errorhandler(500)
+@bp.app_errorhandler(413)
+def payload_too_large(error):
+    """Handle bodies over MAX_CONTENT_LENGTH"""
+    return _payload_too_large(current_app.config['MAX_CONTENT_LENGTH'])
+
+
+@bp.app_errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
     logger.error(f"Internal server error: {str(error)}")
     return jsonify({'error': 'Internal server error'}), 500
 
 
+def create_app(warm_services: Optional[bool] = None) -> Flask:
+    """
+    Create the Flask application
+
+    Args:
+        warm_services: Build services on a background thread right away
+            (defaults to the WARM_SERVICES setting)
+    """
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = get_max_request_bytes()
+    app.register_blueprint(bp)
+    
+    if warm_services is None:
+        warm_services = get_warm_services()
+    app.config['WARM_SERVICES'] = warm_services
+    tasks = [_warm_segment_cache] if get_segment_profiles_path() else []
+    if warm_services or tasks:
+        warm_up(SERVICES if warm_services else (recommendation_engine,), tasks=tasks)
+    
+    return app
+
+
+app = create_app()
+
+
 if __name__ == '__main__':
     config = get_flask_config()
     logger.info(f"Starting AI service on port {config['port']}")
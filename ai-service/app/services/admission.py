@@ -0,0 +1,178 @@
+"""Admission control and load shedding in front of the LLM-backed services
+
+A fixed number of requests may call Gemini at once. Further requests wait in
+a priority queue with a bounded length per endpoint. A request is shed right
+away (503 + Retry-After) when its queue is full or when its estimated wait plus
+typical service time would exceed the caller's time budget. A request that
+is still queued when its budget runs out is shed as well.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from app.utils.tracing import span
+
+
+# Lower value = served first
+PRIORITY_TWIN = 0
+PRIORITY_RECOMMENDATIONS = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {
+    'twin': PRIORITY_TWIN,
+    'recommendations': PRIORITY_RECOMMENDATIONS,
+    'batch': PRIORITY_BATCH,
+}
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of admitted"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Service overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'endpoint', 'granted', 'cancelled')
+
+    def __init__(self, priority: int, seq: int, endpoint: str):
+        self.priority = priority
+        self.seq = seq
+        self.endpoint = endpoint
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other: '_Waiter') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    def __init__(self, max_concurrent: int = 8, max_queue: int = 16, ewma_alpha: float = 0.2):
+        """
+        Args:
+            max_concurrent: Requests allowed to run at once
+            max_queue: Waiting requests allowed per endpoint
+            ewma_alpha: Smoothing for the per-endpoint service time estimate
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.ewma_alpha = ewma_alpha
+
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._queued: Dict[str, int] = {}
+        self._service_time: Dict[str, float] = {}
+        self._admitted: Dict[str, int] = {}
+        self._shed: Dict[str, Dict[str, int]] = {}
+
+    def _waiters_ahead(self, priority: int) -> int:
+        return sum(1 for w in self._heap if not w.cancelled and w.priority <= priority)
+
+    def _estimated_wait(self, ahead: int) -> float:
+        """Seconds until a new waiter with this many requests ahead would get a slot"""
+        typical = max(self._service_time.values(), default=0.0)
+        return (ahead + 1) / self.max_concurrent * typical
+
+    def _record_shed(self, endpoint: str, reason: str) -> None:
+        counts = self._shed.setdefault(endpoint, {})
+        counts[reason] = counts.get(reason, 0) + 1
+
+    def acquire(self, endpoint: str, priority: int, budget: float) -> None:
+        """
+        Wait for a slot or raise Overloaded
+
+        Args:
+            endpoint: Endpoint name for queue bounds and metrics
+            priority: Queue priority (see PRIORITY_*)
+            budget: Seconds the caller is willing to wait for the whole request
+        """
+        deadline = time.monotonic() + budget
+        with self._cond:
+            ahead = self._waiters_ahead(priority)
+            if self._in_flight < self.max_concurrent and ahead == 0:
+                self._in_flight += 1
+                self._admitted[endpoint] = self._admitted.get(endpoint, 0) + 1
+                return
+
+            estimated_wait = self._estimated_wait(ahead)
+
+            if self._queued.get(endpoint, 0) >= self.max_queue:
+                self._record_shed(endpoint, 'queue_full')
+                raise Overloaded('queue_full', max(1.0, estimated_wait))
+
+            if estimated_wait + self._service_time.get(endpoint, 0.0) > budget:
+                self._record_shed(endpoint, 'deadline')
+                raise Overloaded('deadline', max(1.0, estimated_wait))
+
+            waiter = _Waiter(priority, next(self._seq), endpoint)
+            heapq.heappush(self._heap, waiter)
+            self._queued[endpoint] = self._queued.get(endpoint, 0) + 1
+            try:
+                while not waiter.granted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        waiter.cancelled = True
+                        self._record_shed(endpoint, 'queue_timeout')
+                        retry_after = self._estimated_wait(self._waiters_ahead(priority))
+                        raise Overloaded('queue_timeout', max(1.0, retry_after))
+                    self._cond.wait(remaining)
+            finally:
+                self._queued[endpoint] -= 1
+
+            self._admitted[endpoint] = self._admitted.get(endpoint, 0) + 1
+
+    def release(self, endpoint: str, service_time: Optional[float] = None) -> None:
+        """Free a slot and hand it to the highest-priority waiter"""
+        with self._cond:
+            if service_time is not None:
+                previous = self._service_time.get(endpoint)
+                self._service_time[endpoint] = service_time if previous is None else \
+                    previous + self.ewma_alpha * (service_time - previous)
+
+            self._in_flight -= 1
+            while self._heap and self._in_flight < self.max_concurrent:
+                waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                waiter.granted = True
+                self._in_flight += 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, endpoint: str, priority: int, budget: float):
+        """Hold a slot for the duration of the block"""
+        with span('admission_wait'):
+            self.acquire(endpoint, priority, budget)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(endpoint, time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, admissions and shed counts"""
+        with self._cond:
+            return {
+                'in_flight': self._in_flight,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'queue_depth': {endpoint: depth for endpoint, depth in self._queued.items()},
+                'admitted': dict(self._admitted),
+                'shed': {endpoint: dict(counts) for endpoint, counts in self._shed.items()},
+                'service_time_ms': {
+                    endpoint: round(seconds * 1000, 1) for endpoint, seconds in self._service_time.items()
+                },
+            }
+
+
+def retry_after_header(error: Overloaded) -> str:
+    """Retry-After value in whole seconds"""
+    return str(int(math.ceil(error.retry_after)))
@@ -0,0 +1,119 @@
+"""Micro-batching of concurrent model calls
+
+Requests that arrive within a short window share one model call. The first
+request opens a batch and waits out the window, or until the batch is full.
+Requests arriving meanwhile join the batch and wait for the first one to run
+it. Each caller then gets its own result back.
+
+A caller gets NotBatched and makes its own call when its batch had no other
+requests, when the batched call failed, or when the response had nothing
+usable for it. Batching costs up to one window of latency per request. In
+return it cuts the number of model calls, which matters when the provider
+limits requests per minute rather than tokens. Run benchmarks/batching.py to
+see the trade-off.
+"""
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class NotBatched(RuntimeError):
+    """Raised to a caller that should make its own call instead"""
+
+
+class _Batch:
+    __slots__ = ('items', 'results', 'full', 'done')
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.results: List[Optional[Any]] = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        run_batch: Callable[[List[Any]], List[Optional[Any]]],
+        window: float = 0.005,
+        max_size: int = 8
+    ):
+        """
+        Args:
+            run_batch: Called with two or more items; returns one result per item, None where it has none
+            window: Seconds the first request waits for others to join
+            max_size: Batch size that is sent without waiting out the window
+        """
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max(2, max_size)
+        self._open: Optional[_Batch] = None
+        self._lock = threading.Lock()
+        self._counts = {'batches': 0, 'batched': 0, 'alone': 0, 'failed': 0}
+
+    def submit(self, item: Any) -> Any:
+        """
+        Add item to the open batch and wait for its result
+
+        Raises:
+            NotBatched: If the caller should make its own call for this item
+        """
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_size:
+                self._open = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._run(batch)
+        else:
+            batch.done.wait()
+
+        result = batch.results[index]
+        if result is None:
+            raise NotBatched("No batched result for this request")
+        return result
+
+    def _run(self, batch: _Batch) -> None:
+        size = len(batch.items)
+        results: List[Optional[Any]] = [None] * size
+        try:
+            if size > 1:
+                results = list(self.run_batch(list(batch.items)))
+                if len(results) != size:
+                    raise ValueError(f"expected {size} results, got {len(results)}")
+        except Exception as e:
+            logger.error(f"Batch of {size} requests failed, sending them individually: {str(e)}")
+            results = [None] * size
+        finally:
+            batch.results = results
+            batch.done.set()
+
+        with self._lock:
+            if size == 1:
+                self._counts['alone'] += 1
+            else:
+                self._counts['batches'] += 1
+                self._counts['batched'] += size
+                self._counts['failed'] += sum(1 for result in results if result is None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        counts['window_ms'] = round(self.window * 1000, 3)
+        counts['max_size'] = self.max_size
+        calls = counts['batches'] + counts['alone']
+        counts['mean_batch_size'] = round((counts['batched'] + counts['alone']) / calls, 2) if calls else 0.0
+        return counts
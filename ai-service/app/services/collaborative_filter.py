@@ -0,0 +1,285 @@
+"""Item-item collaborative filtering built from exported interaction data"""
+import argparse
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from app.utils.artifacts import Artifact, ArtifactStore, lookup_ids, publish_artifact, sorted_id_arrays
+from app.utils.exports import load_records
+
+
+# Relative strength of each interaction type from the interactions table
+INTERACTION_WEIGHTS = {
+    'view': 1.0,
+    'click': 1.5,
+    'read': 2.0,
+    'bookmark': 3.0,
+    'share': 3.0,
+}
+
+
+def load_interactions(path: str) -> List[Dict[str, Any]]:
+    """
+    Load an export of the interactions table
+
+    Rows need at least user_id, content_id, content_type and interaction_type.
+    """
+    return load_records(path)
+
+
+def _item_key(content_type: str, content_id: str) -> str:
+    return f"{content_type}:{content_id}"
+
+
+def _history_rows(artifact: Artifact, interactions: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Item rows for a list of interactions (-1 when unknown)
+
+    Returns:
+        Rows, and for each row the position of the interaction it belongs to.
+        An interaction without a content type matches its ID under every type.
+    """
+    keys: List[str] = []
+    positions: List[int] = []
+    if artifact.metadata.get('id_keys') != 'type:id':
+        # Models built before items were keyed by type
+        keys = [str(i.get('content_id', '')) for i in interactions]
+        positions = list(range(len(interactions)))
+    else:
+        for position, interaction in enumerate(interactions):
+            content_id = str(interaction.get('content_id', ''))
+            content_type = interaction.get('content_type')
+            for t in [content_type] if content_type else artifact.metadata['content_types']:
+                keys.append(_item_key(str(t), content_id))
+                positions.append(position)
+    return lookup_ids(artifact, keys), np.array(positions, dtype=np.int64)
+
+
+def build_item_similarity(
+    interactions: List[Dict[str, Any]],
+    output_dir: str,
+    top_n: int = 50
+) -> str:
+    """
+    Precompute top-N item neighbors using cosine similarity
+
+    The user x item matrix is kept sparse (CSR/CSC index arrays) and each
+    item's co-occurrence row is accumulated with ``np.bincount`` so memory
+    stays linear in the catalog size.
+
+    Args:
+        interactions: Interaction rows (see load_interactions)
+        output_dir: Artifact root; each build is published as a new version
+        top_n: Number of neighbors kept per item
+
+    Returns:
+        The version name that was published
+    """
+    user_index: Dict[str, int] = {}
+    item_index: Dict[Tuple[str, str], int] = {}
+    weights: Dict[Tuple[int, int], float] = {}
+
+    for row in interactions:
+        user_id = row.get('user_id')
+        content_id = row.get('content_id')
+        content_type = row.get('content_type')
+        if not user_id or not content_id or not content_type:
+            continue
+        u = user_index.setdefault(str(user_id), len(user_index))
+        i = item_index.setdefault((str(content_type), str(content_id)), len(item_index))
+        weight = INTERACTION_WEIGHTS.get(row.get('interaction_type'), 1.0)
+        weights[(u, i)] = weights.get((u, i), 0.0) + weight
+
+    n_items = len(item_index)
+    neighbors = np.full((n_items, top_n), -1, dtype=np.int32)
+    scores = np.zeros((n_items, top_n), dtype=np.float32)
+
+    if weights:
+        pairs = np.array(list(weights.keys()), dtype=np.int64)
+        # Dampen repeated interactions so heavy users don't dominate
+        values = np.log1p(np.array(list(weights.values()), dtype=np.float64))
+        users, items = pairs[:, 0], pairs[:, 1]
+
+        # CSR by user: items touched by each user
+        by_user = np.argsort(users, kind='stable')
+        user_items = items[by_user]
+        user_values = values[by_user]
+        user_ptr = np.concatenate(([0], np.cumsum(np.bincount(users, minlength=len(user_index)))))
+
+        # CSC by item: users who touched each item
+        by_item = np.argsort(items, kind='stable')
+        item_users = users[by_item]
+        item_values = values[by_item]
+        item_ptr = np.concatenate(([0], np.cumsum(np.bincount(items, minlength=n_items))))
+
+        norms = np.sqrt(np.bincount(items, weights=values ** 2, minlength=n_items))
+
+        for i in range(n_items):
+            cols = []
+            vals = []
+            for k in range(item_ptr[i], item_ptr[i + 1]):
+                u = item_users[k]
+                start, end = user_ptr[u], user_ptr[u + 1]
+                cols.append(user_items[start:end])
+                vals.append(user_values[start:end] * item_values[k])
+
+            co_occurrence = np.bincount(
+                np.concatenate(cols), weights=np.concatenate(vals), minlength=n_items
+            )
+            similarity = co_occurrence / (norms[i] * norms + 1e-12)
+            similarity[i] = 0.0
+
+            k = min(top_n, n_items - 1)
+            if k <= 0:
+                continue
+            top = np.argpartition(-similarity, k - 1)[:k]
+            top = top[np.argsort(-similarity[top], kind='stable')]
+            top = top[similarity[top] > 0]
+            neighbors[i, :len(top)] = top
+            scores[i, :len(top)] = similarity[top]
+
+    content_types = sorted({content_type for content_type, _ in item_index})
+    type_codes = {content_type: code for code, content_type in enumerate(content_types)}
+    item_ids = np.array([content_id for _, content_id in item_index], dtype=str)
+    item_types = np.array([type_codes[content_type] for content_type, _ in item_index], dtype=np.uint8)
+    # The same ID can name items of different types, so lookups go by type and ID
+    item_keys = np.array([_item_key(content_type, content_id) for content_type, content_id in item_index], dtype=str)
+
+    return publish_artifact(
+        output_dir,
+        arrays={
+            'neighbors': neighbors,
+            'scores': scores,
+            'item_ids': item_ids,
+            'item_types': item_types,
+            **sorted_id_arrays(item_keys),
+        },
+        metadata={
+            'kind': 'item_similarity',
+            'id_keys': 'type:id',
+            'content_types': content_types,
+            'top_n': top_n,
+            'interactions': len(interactions),
+        }
+    )
+
+
+# Models reopened in offload worker processes, by model directory
+_worker_models: Dict[str, 'CollaborativeFilterModel'] = {}
+
+
+def _shared_model(model_dir: str, check_interval: float) -> 'CollaborativeFilterModel':
+    model = _worker_models.get(model_dir)
+    if model is None:
+        model = _worker_models[model_dir] = CollaborativeFilterModel(model_dir, check_interval)
+    return model
+
+
+class CollaborativeFilterModel:
+    def __init__(self, model_dir: str, check_interval: float = 30.0):
+        """
+        Serve precomputed neighbor lists from a memory-mapped artifact
+
+        Args:
+            model_dir: Artifact root written by build_item_similarity
+            check_interval: Seconds between checks for a newly published version
+        """
+        self.model_dir = model_dir
+        self.check_interval = check_interval
+        self.store = ArtifactStore(model_dir, check_interval=check_interval)
+        self.store.refresh(force=True)
+
+    def __reduce__(self):
+        # Offload workers reopen the memory-mapped artifact instead of receiving arrays
+        return _shared_model, (self.model_dir, self.check_interval)
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.store.version
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.store.version is not None
+
+    def candidates(
+        self,
+        interaction_history: List[Dict[str, Any]],
+        limit: int,
+        max_history: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        Score unseen items by their similarity to the user's recent interactions
+
+        Args:
+            interaction_history: List of user interactions, oldest first
+            limit: Maximum number of candidates to return
+            max_history: Number of most recent interactions considered
+
+        Returns:
+            List of recommendation dictionaries
+        """
+        artifact = self.store.current()
+        if artifact is None or not interaction_history:
+            return []
+
+        recent = interaction_history[-max_history:]
+        indices, positions = _history_rows(artifact, recent)
+
+        # Newer interactions count more than older ones
+        weights = np.array([
+            INTERACTION_WEIGHTS.get(i.get('interaction_type'), 1.0)
+            * (0.5 + 0.5 * (position + 1) / len(recent))
+            for position, i in enumerate(recent)
+        ])[positions]
+        known = indices >= 0
+        if not known.any():
+            return []
+
+        neighbors = artifact['neighbors'][indices[known]]
+        contributions = artifact['scores'][indices[known]] * weights[known, None]
+        valid = neighbors >= 0
+        items, inverse = np.unique(neighbors[valid], return_inverse=True)
+        totals = np.bincount(inverse, weights=contributions[valid])
+
+        seen, _ = _history_rows(artifact, interaction_history)
+        unseen = ~np.isin(items, seen)
+        items, totals = items[unseen], totals[unseen]
+        if len(items) == 0:
+            return []
+
+        ranked = np.argsort(-totals, kind='stable')[:limit]
+        best = totals[ranked[0]]
+        content_types = artifact.metadata['content_types']
+        item_ids = artifact['item_ids']
+        item_types = artifact['item_types']
+
+        recommendations = []
+        for position in ranked:
+            idx = items[position]
+            content_type = content_types[item_types[idx]]
+            recommendations.append({
+                'content_id': str(item_ids[idx]),
+                'content_type': content_type,
+                'score': round(float(totals[position] / best), 4),
+                'reasoning': f"Readers with similar activity also explored this {content_type.replace('_', ' ')}"
+            })
+
+        return recommendations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build item-item similarity lists from an interactions export')
+    parser.add_argument('input', help='CSV or Parquet export of the interactions table')
+    parser.add_argument('output', help='Model directory (e.g. the CF_MODEL_DIR used by the service)')
+    parser.add_argument('--top-n', type=int, default=50, help='Neighbors kept per item')
+    args = parser.parse_args()
+
+    start = time.time()
+    interactions = load_interactions(args.input)
+    version = build_item_similarity(interactions, args.output, top_n=args.top_n)
+    print(f"Built {version} from {len(interactions)} interactions in {time.time() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
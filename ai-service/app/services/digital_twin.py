@@ -1,24 +1,95 @@
 """Digital Twin Service using Google Gemini"""
 import google.generativeai as genai
-from typing import List, Dict, Any, Optional
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Tuple, Callable, ContextManager
+import difflib
+import hashlib
 import time
 import re
 from app.models import ConversationContext, PreferenceProfile
-from app.utils import get_gemini_api_key
+from app.services.admission import Overloaded
+from app.services.similarity_index import SimilarityIndex
+from app.services.twin_routing import (
+    RoutingStats,
+    classify_message,
+    TIER_FAST,
+    TIER_FULL,
+    TIER_TEMPLATE,
+)
+from app.utils import get_gemini_api_key, get_twin_model_config, get_cache_config
+from app.utils.cache import TieredCache
+from app.utils.tracing import span
+
+
+# Tag used in responses for each catalog content type
+CONTENT_TAGS = {
+    'ghost_entity': 'GHOST',
+    'story': 'STORY',
+    'movie': 'MOVIE',
+    'myth': 'MYTH',
+}
+
+# [TYPE:id] reference, with the whitespace before it so a dropped tag leaves no gap
+REFERENCE_PATTERN = re.compile(r'(\s?)\[(GHOST|STORY|MOVIE|MYTH):([^\]]+)\]')
+
+# How close an unknown ID must be to a catalog ID to be corrected rather than dropped
+REFERENCE_MATCH_CUTOFF = 0.85
+
+# Canned replies for intents that don't need a model
+TEMPLATE_RESPONSES = {
+    'greeting': "Greetings, fellow seeker of the supernatural! What would you like to explore tonight?",
+    'thanks': "You're most welcome. The spirits and I are always here when you want to learn more.",
+    'farewell': "Farewell for now. Mind the shadows on your way out!",
+    'help': (
+        "I'm your Ghostypedia guide. Ask me about ghosts, creatures, myths and folklore, "
+        "or ask for recommendations and I'll point you to stories and entities you'll enjoy."
+    ),
+}
 
 
 class DigitalTwinService:
-    def __init__(self):
-        """Initialize the digital twin service with Gemini API"""
+    def __init__(self, similarity_index: Optional[SimilarityIndex] = None):
+        """
+        Initialize the digital twin service with Gemini API
+        
+        Args:
+            similarity_index: Optional catalog index used to ground content references
+        """
         genai.configure(api_key=get_gemini_api_key())
-        self.model = genai.GenerativeModel('gemini-pro')
+        model_config = get_twin_model_config()
+        self.model = genai.GenerativeModel(model_config['full_model'])
         self.response_timeout = 3.0  # 3 second timeout
+        self.similarity_index = similarity_index
+        self.grounding_items = 5
+        
+        # Model tiers: simple lookups go to a faster model with a smaller output limit
+        self.routing_enabled = model_config['routing']
+        self.tiers = {
+            TIER_FAST: {
+                'model': genai.GenerativeModel(model_config['fast_model']),
+                'max_output_tokens': 200,
+            },
+            TIER_FULL: {
+                'model': self.model,
+                'max_output_tokens': 500,
+            },
+        }
+        self.routing_stats = RoutingStats()
+        
+        # Model output keyed by the exact prompt, so a hit is only possible when
+        # the message, preferences, history and grounding all match
+        self.response_cache = TieredCache('twin_responses', **get_cache_config())
+    
+    def route(self, message: str) -> Dict[str, Any]:
+        """Intent and model tier for a message ({'intent', 'tier', 'subject'})"""
+        return classify_message(message) if self.routing_enabled else {'intent': 'open', 'tier': TIER_FULL}
     
     def generate_response(
         self,
         user_id: str,
         message: str,
-        context: Dict[str, Any]
+        context: Dict[str, Any],
+        admit: Optional[Callable[[], ContextManager]] = None
     ) -> Dict[str, Any]:
         """
         Generate a personalized response from the digital twin
@@ -27,35 +98,66 @@ class DigitalTwinService:
             user_id: User identifier
             message: User's message
             context: Conversation context including preferences and history
+            admit: Context manager factory entered only around the model call,
+                so template replies and cache hits skip it
             
         Returns:
             Dictionary with response and metadata
+            
+        Raises:
+            Overloaded: If admit sheds the request
         """
         start_time = time.time()
+        route = self.route(message)
+        admit = admit or nullcontext
         
         try:
-            # Build context for the AI
-            system_context = self._build_context(context)
-            
-            # Create the prompt
-            prompt = self._create_prompt(message, system_context)
+            grounded_items = []
+            if route['tier'] == TIER_TEMPLATE:
+                response = self._template_response(route['intent'], context)
+            else:
+                with span('prompt_build'):
+                    # Build context for the AI
+                    system_context = self._build_context(context)
+                    grounding, grounded_items = self._build_grounding(route.get('subject') or message, context)
+                    if grounding:
+                        system_context = f"{system_context}\n\n{grounding}" if system_context else grounding
+                    
+                    # Create the prompt
+                    prompt = self._create_prompt(message, system_context, concise=route['tier'] == TIER_FAST)
+                
+                # Reuse an identical prompt's answer, otherwise generate with timeout handling
+                cache_key = f"{route['tier']}_{hashlib.sha1(prompt.encode('utf-8')).hexdigest()}"
+                with span('cache_lookup'):
+                    response = self.response_cache.get(cache_key)
+                if response is None:
+                    with admit():
+                        response = self._generate_with_timeout(prompt, tier=route['tier'])
+                    self.response_cache.set(cache_key, response)
             
-            # Generate response with timeout handling
-            response = self._generate_with_timeout(prompt)
-            
-            # Extract content references
-            content_refs = self._extract_content_references(response)
+            # Check references against the catalog and attach their details
+            with span('references'):
+                response, content_refs = self._resolve_references(
+                    response,
+                    [item['content_id'] for item in grounded_items]
+                )
             
             elapsed_time = time.time() - start_time
+            self.routing_stats.record(route['intent'], route['tier'], elapsed_time)
             
             return {
                 'response': response,
                 'content_references': content_refs,
                 'response_time': elapsed_time,
+                'tier': route['tier'],
                 'success': True
             }
         
+        except Overloaded:
+            raise
         except TimeoutError:
+            # Failures are the slowest requests in their tier, so they count toward its latency
+            self.routing_stats.record(route['intent'], route['tier'], time.time() - start_time)
             return {
                 'response': "I'm taking a bit longer to think about that. Could you rephrase your question?",
                 'content_references': [],
@@ -64,6 +166,7 @@ class DigitalTwinService:
                 'error': 'timeout'
             }
         except Exception as e:
+            self.routing_stats.record(route['intent'], route['tier'], time.time() - start_time)
             return {
                 'response': "I'm having trouble connecting right now. Please try again in a moment.",
                 'content_references': [],
@@ -110,7 +213,48 @@ class DigitalTwinService:
         
         return "\n".join(context_parts)
     
-    def _create_prompt(self, user_message: str, system_context: str) -> str:
+    def _build_grounding(self, message: str, context: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        """List catalog items related to the message so references point at real content"""
+        if self.similarity_index is None:
+            return "", []
+        
+        preferences = context.get('user_preferences', {}) or {}
+        query = ' '.join([message] + list(preferences.get('favorite_ghost_types', [])))
+        related = self.similarity_index.similar_to_text(
+            query,
+            k=self.grounding_items,
+            approximate=True
+        )
+        if not related:
+            return "", []
+        
+        lines = ["Available Ghostypedia Content (only reference items from this list):"]
+        for item in related:
+            tag = CONTENT_TAGS.get(item['content_type'], item['content_type'].upper())
+            lines.append(f"- [{tag}:{item['content_id']}] {item['title']}")
+        return "\n".join(lines), related
+    
+    def _template_response(self, intent: str, context: Dict[str, Any]) -> str:
+        """Answer trivial intents without a model call, suggesting catalog content when possible"""
+        response = TEMPLATE_RESPONSES[intent]
+        if intent not in ('greeting', 'help') or self.similarity_index is None:
+            return response
+        
+        preferences = context.get('user_preferences', {}) or {}
+        interests = list(preferences.get('favorite_ghost_types', [])) + list(preferences.get('cultural_interests', []))
+        if not interests:
+            return response
+        
+        suggestions = self.similarity_index.similar_to_text(' '.join(interests), k=2, approximate=True)
+        if suggestions:
+            tags = [
+                f"[{CONTENT_TAGS.get(item['content_type'], item['content_type'].upper())}:{item['content_id']}]"
+                for item in suggestions
+            ]
+            response += f" Since you enjoy {', '.join(interests[:2])}, you might start with {' or '.join(tags)}."
+        return response
+    
+    def _create_prompt(self, user_message: str, system_context: str, concise: bool = False) -> str:
         """Create the full prompt for Gemini"""
         prompt = f"""You are a knowledgeable and friendly digital twin guide for Ghostypedia, an encyclopedia of ghosts, creatures, myths, and paranormal entities. Your role is to:
 
@@ -132,22 +276,27 @@ User Message: {user_message}
 
 Respond in a conversational, engaging way. Keep responses concise (2-3 paragraphs max). If you reference specific content, include the appropriate tags."""
         
+        if concise:
+            prompt += "\n\nThis is a simple question: answer it directly in one short paragraph."
+        
         return prompt
     
-    def _generate_with_timeout(self, prompt: str) -> str:
+    def _generate_with_timeout(self, prompt: str, tier: str = TIER_FULL) -> str:
         """Generate response with timeout handling"""
         start_time = time.time()
+        tier_config = self.tiers[tier]
         
         # Configure generation with timeout considerations
         generation_config = genai.types.GenerationConfig(
-            max_output_tokens=500,  # Limit response length for faster generation
+            max_output_tokens=tier_config['max_output_tokens'],  # Limit response length for faster generation
             temperature=0.7,
         )
         
-        response = self.model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
+        with span('llm_wait', tier=tier):
+            response = tier_config['model'].generate_content(
+                prompt,
+                generation_config=generation_config
+            )
         
         elapsed = time.time() - start_time
         
@@ -172,6 +321,87 @@ Respond in a conversational, engaging way. Keep responses concise (2-3 paragraph
         
         return references
     
+    def _resolve_references(
+        self,
+        response: str,
+        preferred_ids: List[str]
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Check every content reference in the response against the catalog in one batch
+        
+        Known IDs get the catalog's content type, title and image. Unknown IDs are
+        corrected to a close catalog ID when there is one, preferring the items the
+        prompt was grounded with, and are otherwise removed from the response.
+        Without a loaded catalog the references are returned unchecked.
+        
+        Args:
+            response: Model or template response text
+            preferred_ids: Catalog IDs listed in the prompt
+            
+        Returns:
+            Response with tags corrected or removed, and the deduplicated references
+        """
+        matches = list(REFERENCE_PATTERN.finditer(response))
+        catalog = None
+        if matches and self.similarity_index is not None:
+            catalog = self.similarity_index.lookup([match.group(3).strip() for match in matches])
+        if catalog is None:
+            return response, self._extract_content_references(response)
+        
+        # Correct the unknown IDs, then look the corrections up in a second batch
+        corrections = {}
+        for match, item in zip(matches, catalog):
+            content_id = match.group(3).strip()
+            if item is None and content_id not in corrections:
+                corrections[content_id] = self._closest_catalog_id(content_id, preferred_ids)
+        corrected_ids = sorted({content_id for content_id in corrections.values() if content_id})
+        corrected_items = dict(zip(corrected_ids, self.similarity_index.lookup(corrected_ids) or []))
+        
+        references = []
+        seen = set()
+        resolved = iter(catalog)
+        
+        def rewrite(match: re.Match) -> str:
+            content_id = match.group(3).strip()
+            item = next(resolved)
+            if item is None:
+                item = corrected_items.get(corrections.get(content_id))
+                if item is None:
+                    return ''
+                item = dict(item, corrected_from=content_id)
+            
+            key = (item['content_type'], item['content_id'])
+            if key not in seen:
+                seen.add(key)
+                references.append(item)
+            tag = CONTENT_TAGS.get(item['content_type'], item['content_type'].upper())
+            return f"{match.group(1)}[{tag}:{item['content_id']}]"
+        
+        return REFERENCE_PATTERN.sub(rewrite, response), references
+    
+    def _closest_catalog_id(self, content_id: str, preferred_ids: List[str]) -> Optional[str]:
+        """
+        Catalog ID the model most likely meant, from the grounded items and the IDs sorting nearby
+        
+        Case-only differences always match. Otherwise the most similar candidate
+        above REFERENCE_MATCH_CUTOFF wins, with ties going to the grounded items.
+        """
+        preferred = set(preferred_ids)
+        candidates = list(preferred_ids)
+        for key in {content_id, content_id.casefold()}:
+            candidates.extend(self.similarity_index.nearby_ids(key))
+        
+        best, best_key = None, (REFERENCE_MATCH_CUTOFF, False)
+        matcher = difflib.SequenceMatcher(b=content_id.casefold())
+        for candidate in candidates:
+            if candidate.casefold() == content_id.casefold():
+                return candidate
+            matcher.set_seq1(candidate.casefold())
+            key = (matcher.ratio(), candidate in preferred)
+            if key > best_key:
+                best, best_key = candidate, key
+        return best
+    
     def get_conversation_history(
         self,
         user_id: str,
@@ -0,0 +1,182 @@
+"""Configurable execution backend for CPU-bound recommendation stages
+
+Parsing large model outputs, diversity re-ranking and collaborative filtering
+hold the GIL. When they run on a Flask thread, every other request in the
+worker waits. The offloader runs each stage in one of three ways:
+
+- ``inline``: on the calling thread (the default)
+- ``thread``: on a thread pool, which only helps the stages where numpy releases the GIL
+- ``process``: on a pool of worker processes started ahead of time
+
+Inputs below a per-stage size threshold always run inline, because handing
+small inputs to another process costs more than the work itself. Worker
+processes reopen model artifacts from disk. The artifacts are memory-mapped,
+so every process shares the same pages and nothing large is pickled. Run
+benchmarks/offload.py to find the crossover sizes on a given machine.
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('inline', 'thread', 'process')
+
+# Input size per stage below which a stage always runs inline. Units: parse,
+# characters of model output; diversity, recommendations; candidates,
+# interactions in the history. From benchmarks/offload.py: parsing 185KB takes
+# ~3ms inline and the process pool adds ~3ms. At 1.8MB, inline parsing pushes a
+# concurrent request's p95 to ~36ms, against ~4ms when offloaded. Diversity
+# pickles its input and output dicts, so the pool is 20-30x slower per call at
+# every realistic size. Candidates mostly run in numpy and only look at the
+# last 50 interactions, so requests (at most 500 interactions) never gain.
+DEFAULT_THRESHOLDS = {
+    'parse': 256 * 1024,
+    'diversity': 50000,
+    'candidates': 50000,
+}
+
+# Largest input each stage can get from a validated request: Gemini output is
+# capped at 8192 tokens (~32KB), requests ask for at most 50 recommendations,
+# and histories hold at most 500 interactions. With the default thresholds no
+# stage reaches its threshold, so no pool is started unless OFFLOAD_THRESHOLD_*
+# lowers one.
+MAX_STAGE_SIZES = {
+    'parse': 64 * 1024,
+    'diversity': 100,
+    'candidates': 500,
+}
+
+
+def _call_pickled(payload: bytes) -> Any:
+    fn, args = pickle.loads(payload)
+    return fn(*args)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class Offloader:
+    def __init__(
+        self,
+        backend: str = 'inline',
+        workers: Optional[int] = None,
+        thresholds: Optional[Dict[str, int]] = None,
+        max_sizes: Optional[Dict[str, int]] = None
+    ):
+        """
+        Args:
+            backend: 'inline', 'thread' or 'process'
+            workers: Pool size (default: half the CPUs, at least 1)
+            thresholds: Per-stage minimum input size to offload (merged over DEFAULT_THRESHOLDS)
+            max_sizes: Per-stage largest expected input (merged over MAX_STAGE_SIZES)
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown offload backend '{backend}' (expected one of: {', '.join(BACKENDS)})")
+        self.backend = backend
+        self.workers = workers or max(1, (os.cpu_count() or 2) // 2)
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        max_sizes = dict(MAX_STAGE_SIZES, **(max_sizes or {}))
+        if backend != 'inline' and all(
+            self.thresholds.get(stage, 0) > size for stage, size in max_sizes.items()
+        ):
+            logger.warning(
+                f"Offload backend '{backend}' has no stage whose threshold can be reached; running inline "
+                f"(lower an OFFLOAD_THRESHOLD_* setting to offload)"
+            )
+        elif backend != 'inline':
+            try:
+                self._executor = self._start()
+            except Exception as e:
+                # Serving inline beats failing to build the engine
+                logger.error(f"Failed to start {backend} offload pool, running inline: {str(e)}")
+
+    def _start(self) -> Executor:
+        if self.backend == 'thread':
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='offload')
+
+        # fork is unsafe once gRPC and Flask threads are running
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+        # Prefork so the first requests don't pay for process start-up
+        pids = {future.result() for future in [executor.submit(_ping) for _ in range(self.workers * 2)]}
+        logger.info(f"Started {len(pids)} offload worker processes ({method})")
+        return executor
+
+    def _count(self, stage: str, mode: str) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(stage, {})
+            counts[mode] = counts.get(mode, 0) + 1
+
+    def run(self, stage: str, size: int, fn: Callable[..., Any], *args) -> Any:
+        """
+        Run fn(*args) on the configured backend
+
+        Args:
+            stage: Stage name, used for the size threshold and metrics
+            size: Input size in the stage's unit (see DEFAULT_THRESHOLDS)
+            fn: Module-level function (it is pickled for the process backend)
+        """
+        executor = self._executor
+        if executor is None or size < self.thresholds.get(stage, 0):
+            self._count(stage, 'inline')
+            return fn(*args)
+
+        if self.backend == 'process':
+            # Pickle here so a non-picklable call is caught before it reaches the pool
+            try:
+                payload = pickle.dumps((fn, args), protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.error(f"Cannot send {stage} to the offload pool, running inline: {str(e)}")
+                self._count(stage, 'inline')
+                return fn(*args)
+            fn, args = _call_pickled, (payload,)
+
+        try:
+            result = executor.submit(fn, *args).result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. OOM-killed); serve inline and replace the pool
+            logger.error(f"Offload pool broken during {stage}: {str(e)}")
+            self._restart(executor)
+            self._count(stage, 'inline')
+            return fn(*args)
+        self._count(stage, self.backend)
+        return result
+
+    def _restart(self, broken: Executor) -> None:
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+        broken.shutdown(wait=False)
+        try:
+            executor = self._start()
+        except Exception as e:
+            logger.error(f"Failed to restart offload pool, running inline: {str(e)}")
+            return
+        with self._lock:
+            self._executor = executor
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'workers': self.workers if self._executor is not None else 0,
+                'thresholds': dict(self.thresholds),
+                'runs': {stage: dict(counts) for stage, counts in self._counts.items()},
+            }
+
+    def shutdown(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,89 @@
+"""CPU-bound recommendation stages as plain functions
+
+Kept free of Gemini and Flask imports so they can run in offload worker
+processes (see app/services/offload.py) without loading the whole service.
+"""
+import json
+from typing import List, Dict, Any
+
+
+REQUIRED_FIELDS = ('content_id', 'content_type', 'score', 'reasoning')
+
+
+def _strip_code_fence(response_text: str) -> str:
+    """Remove markdown code blocks if present"""
+    text = response_text.strip()
+    if text.startswith('```'):
+        text = text.split('```')[1]
+        if text.startswith('json'):
+            text = text[4:]
+    return text.strip()
+
+
+def _validated(recommendations: Any) -> List[Dict[str, Any]]:
+    """Recommendations that have every required field"""
+    if not isinstance(recommendations, list):
+        return []
+    return [rec for rec in recommendations if isinstance(rec, dict) and all(key in rec for key in REQUIRED_FIELDS)]
+
+
+def parse_recommendations(response_text: str) -> List[Dict[str, Any]]:
+    """Parse Gemini API response into recommendation list"""
+    try:
+        return _validated(json.loads(_strip_code_fence(response_text)))
+    except json.JSONDecodeError:
+        return []
+
+
+def parse_batch_recommendations(response_text: str, keys: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Split a multi-user response into one recommendation list per request key
+
+    Args:
+        response_text: JSON object mapping each key to a recommendation array
+        keys: Request keys used in the prompt
+
+    Returns:
+        Valid, non-empty recommendation lists by key; keys without one are left out
+    """
+    try:
+        by_key = json.loads(_strip_code_fence(response_text))
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(by_key, dict):
+        return {}
+
+    parsed = {}
+    for key in keys:
+        recommendations = _validated(by_key.get(key))
+        if recommendations:
+            parsed[key] = recommendations
+    return parsed
+
+
+def ensure_diversity(recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Ensure recommendations include diverse content types"""
+    if not recommendations:
+        return recommendations
+
+    # Group by content type
+    by_type = {}
+    for rec in recommendations:
+        content_type = rec.get('content_type', 'ghost_entity')
+        if content_type not in by_type:
+            by_type[content_type] = []
+        by_type[content_type].append(rec)
+
+    # If we have good diversity (3+ types), return as is
+    if len(by_type) >= 3:
+        return recommendations
+
+    # Otherwise, try to balance the types
+    diverse_recs = []
+    content_types = list(by_type.keys())
+    max_per_type = max(3, len(recommendations) // len(content_types))
+
+    for content_type in content_types:
+        diverse_recs.extend(by_type[content_type][:max_per_type])
+
+    return diverse_recs
@@ -1,9 +1,84 @@
 """Recommendation Engine Service using Google Gemini"""
 import google.generativeai as genai
-from typing import List, Dict, Any
+from collections import Counter
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Tuple, Callable, ContextManager
+import hashlib
 import json
+import threading
+import time
+import zlib
 from app.models import PreferenceProfile, Interaction, Recommendation, ContentType
-from app.utils import get_gemini_api_key
+from app.services.batching import MicroBatcher, NotBatched
+from app.services.collaborative_filter import CollaborativeFilterModel
+from app.services.offload import Offloader
+from app.services.ranking import ensure_diversity, parse_batch_recommendations, parse_recommendations
+from app.utils import (
+    get_gemini_api_key,
+    get_cf_model_dir,
+    get_cache_config,
+    get_offload_config,
+    get_batching_config,
+)
+from app.utils import capture
+from app.utils.cache import TieredCache
+from app.utils.tracing import span
+
+
+# Spookiness levels that share cold-start results, and the level used in their prompt
+SPOOKINESS_BUCKETS = {1: 'mild', 2: 'mild', 3: 'moderate', 4: 'intense', 5: 'intense'}
+BUCKET_LEVELS = {'mild': 2, 'moderate': 3, 'intense': 4}
+
+# Instructions shared by single-user and multi-user personalized prompts
+PERSONALIZED_GUIDELINES = """diverse recommendations that:
+1. Build on their recent interests
+2. Introduce new but related content
+3. Match their spookiness comfort level
+4. Include multiple content types (ghost_entity, story, movie, myth)
+
+For each recommendation, provide:
+1. content_id (generate a plausible ID)
+2. content_type (ghost_entity, story, movie, or myth)
+3. score (0.0-1.0)
+4. reasoning (brief explanation)"""
+
+
+def _normalize_names(values: Any) -> Tuple[str, ...]:
+    """Sorted, lowercased, de-duplicated names; accepts lists or Postgres array literals"""
+    if isinstance(values, str):
+        values = values.strip('{}').split(',')
+    return tuple(sorted({str(v).strip().strip('"').lower() for v in values or [] if str(v).strip()}))
+
+
+def profile_segment(preference_profile: Dict[str, Any]) -> Tuple:
+    """
+    Canonical cold-start segment for a preference profile
+
+    Users with the same ghost types, content types, cultures and spookiness
+    bucket get the same cold-start recommendations; the user ID is not part
+    of the segment.
+    """
+    try:
+        spookiness = int(preference_profile.get('spookiness_level', 3))
+    except (TypeError, ValueError):
+        spookiness = 3
+    return (
+        _normalize_names(preference_profile.get('favorite_ghost_types')),
+        _normalize_names(preference_profile.get('preferred_content_types')),
+        _normalize_names(preference_profile.get('cultural_interests')),
+        SPOOKINESS_BUCKETS.get(spookiness, 'moderate'),
+    )
+
+
+def segment_profile(segment: Tuple) -> Dict[str, Any]:
+    """Preference profile representing a whole segment"""
+    favorite_types, preferred_content, cultural_interests, bucket = segment
+    return {
+        'favorite_ghost_types': list(favorite_types),
+        'preferred_content_types': list(preferred_content),
+        'cultural_interests': list(cultural_interests),
+        'spookiness_level': BUCKET_LEVELS[bucket],
+    }
 
 
 class RecommendationEngine:
@@ -11,14 +86,39 @@ class RecommendationEngine:
         """Initialize the recommendation engine with Gemini API"""
         genai.configure(api_key=get_gemini_api_key())
         self.model = genai.GenerativeModel('gemini-pro')
-        self.cache = {}
+        
+        # Memory tier per worker, optional compressed disk tier shared across workers and restarts
+        cache_config = get_cache_config()
+        self.cache = TieredCache('recommendations', **cache_config)
+        
+        # Cold-start results shared by every user in a profile segment
+        self.segment_ttl = 3600  # Seconds before a segment is regenerated
+        self.segment_cache = TieredCache('segments', **dict(cache_config, ttl=self.segment_ttl))
+        self.segment_size = 20  # Recommendations generated per segment
+        self.segment_shuffle = True  # Vary order within score bands per user
+        # Striped so arbitrary client-supplied segments can't grow a lock table
+        self._segment_locks = [threading.Lock() for _ in range(64)]
+        
+        # Optional precomputed item-item model for history-based candidates
+        cf_model_dir = get_cf_model_dir()
+        self.cf_model = CollaborativeFilterModel(cf_model_dir) if cf_model_dir else None
+        
+        # CPU-bound stages can run off the request thread (see app/services/offload.py)
+        self.offload = Offloader(**get_offload_config())
+        
+        # Concurrent personalized requests can share one multi-user prompt
+        batching_config = get_batching_config()
+        self.batcher = None
+        if batching_config['window'] > 0:
+            self.batcher = MicroBatcher(self._generate_batch, **batching_config)
     
     def generate_recommendations(
         self,
         user_id: str,
         preference_profile: Dict[str, Any],
         interaction_history: List[Dict[str, Any]],
-        limit: int = 10
+        limit: int = 10,
+        admit: Optional[Callable[[], ContextManager]] = None
     ) -> List[Dict[str, Any]]:
         """
         Generate personalized recommendations using Gemini API
@@ -28,37 +128,142 @@ class RecommendationEngine:
             preference_profile: User's preference data
             interaction_history: List of user interactions
             limit: Maximum number of recommendations to return
+            admit: Context manager factory entered only around work that may
+                call Gemini, so cache hits skip it; its exceptions propagate
             
         Returns:
             List of recommendation dictionaries
         """
-        # Check cache first
-        cache_key = f"{user_id}_{hash(json.dumps(preference_profile, sort_keys=True))}"
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        admit = admit or nullcontext
         
-        # Handle cold-start for new users
+        # Handle cold-start for new users from the shared segment cache
         if not interaction_history or len(interaction_history) == 0:
-            recommendations = self._cold_start_recommendations(preference_profile, limit)
-        else:
+            with span('cold_start'):
+                return self._segment_recommendations(user_id, preference_profile, limit, admit)
+        
+        # Check cache first
+        # Stable across processes so the disk tier can be shared
+        profile_hash = hashlib.sha1(json.dumps(preference_profile, sort_keys=True).encode()).hexdigest()[:16]
+        cache_key = f"{user_id}_{profile_hash}"
+        with span('cache_lookup'):
+            cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        with span('personalize'):
             recommendations = self._personalized_recommendations(
                 preference_profile,
                 interaction_history,
-                limit
+                limit,
+                admit
             )
         
         # Apply diversity algorithm
-        diverse_recommendations = self._ensure_diversity(recommendations)
+        with span('diversity'):
+            diverse_recommendations = self._ensure_diversity(recommendations)
         
         # Cache the results
-        self.cache[cache_key] = diverse_recommendations
+        self.cache.set(cache_key, diverse_recommendations)
         
         return diverse_recommendations
     
+    def _segment_recommendations(
+        self,
+        user_id: str,
+        preference_profile: Dict[str, Any],
+        limit: int,
+        admit: Callable[[], ContextManager] = nullcontext
+    ) -> List[Dict[str, Any]]:
+        """Cold-start recommendations shared across the user's profile segment"""
+        segment = profile_segment(preference_profile)
+        recommendations = self._get_segment(segment, limit, admit)
+        return self._order_for_user(recommendations, user_id)[:limit]
+    
+    def _get_segment(
+        self,
+        segment: Tuple,
+        limit: int,
+        admit: Callable[[], ContextManager] = nullcontext
+    ) -> List[Dict[str, Any]]:
+        """Return cached segment results, generating them once per segment"""
+        key = json.dumps(segment)
+        entry = self.segment_cache.get(key)
+        if self._segment_entry_valid(entry, limit):
+            return entry['recommendations']
+        
+        # One Gemini call per segment even when many new users arrive at once
+        with self._segment_locks[hash(segment) % len(self._segment_locks)]:
+            entry = self.segment_cache.get(key)
+            if self._segment_entry_valid(entry, limit):
+                return entry['recommendations']
+            
+            count = max(limit, self.segment_size)
+            profile = segment_profile(segment)
+            with admit():
+                try:
+                    recommendations = self._cold_start_recommendations(profile, count, fallback_on_error=False)
+                except Exception:
+                    recommendations = []
+            if not recommendations:
+                # Don't pin a fallback list on the whole segment
+                return self._fallback_recommendations(profile, limit)
+            
+            recommendations = self._ensure_diversity(recommendations)
+            self.segment_cache.set(key, {
+                'recommendations': recommendations,
+                'requested': count,
+                'created_at': time.time()
+            })
+            return recommendations
+    
+    def _segment_entry_valid(self, entry: Dict[str, Any], limit: int) -> bool:
+        return (
+            entry is not None
+            and entry['requested'] >= limit
+            and time.time() - entry['created_at'] < self.segment_ttl
+        )
+    
+    def _order_for_user(self, recommendations: List[Dict[str, Any]], user_id: str) -> List[Dict[str, Any]]:
+        """Stable per-user tie-break among items in the same score band"""
+        if not self.segment_shuffle:
+            return recommendations
+        
+        def band(rec):
+            try:
+                return -round(float(rec.get('score', 0)), 1)
+            except (TypeError, ValueError):
+                return 0.0
+        
+        return sorted(
+            recommendations,
+            key=lambda rec: (band(rec), zlib.crc32(f"{user_id}:{rec.get('content_id')}".encode()))
+        )
+    
+    def warm_segment_cache(self, profiles: List[Dict[str, Any]], top_n: int = 20) -> int:
+        """
+        Precompute cold-start results for the most common profile segments
+        
+        Args:
+            profiles: Preference profile rows (e.g. a preference_profiles export)
+            top_n: Number of segments to precompute
+            
+        Returns:
+            Number of segments generated
+        """
+        counts = Counter(profile_segment(profile) for profile in profiles)
+        generated = 0
+        for segment, _ in counts.most_common(top_n):
+            if self._segment_entry_valid(self.segment_cache.get(json.dumps(segment)), self.segment_size):
+                continue
+            self._get_segment(segment, self.segment_size)
+            generated += 1
+        return generated
+    
     def _cold_start_recommendations(
         self,
         preference_profile: Dict[str, Any],
-        limit: int
+        limit: int,
+        fallback_on_error: bool = True
     ) -> List[Dict[str, Any]]:
         """Generate recommendations for new users with no interaction history"""
         favorite_types = preference_profile.get('favorite_ghost_types', [])
@@ -87,10 +292,14 @@ For each recommendation, provide:
 Return ONLY a valid JSON array with no additional text."""
         
         try:
-            response = self.model.generate_content(prompt)
-            recommendations = self._parse_gemini_response(response.text)
+            with span('llm_wait', model='recommendations'):
+                response = self.model.generate_content(prompt)
+            with span('parse'):
+                recommendations = self._parse_gemini_response(response.text)
             return recommendations[:limit]
         except Exception as e:
+            if not fallback_on_error:
+                raise
             # Fallback to basic recommendations
             return self._fallback_recommendations(preference_profile, limit)
     
@@ -98,9 +307,51 @@ Return ONLY a valid JSON array with no additional text."""
         self,
         preference_profile: Dict[str, Any],
         interaction_history: List[Dict[str, Any]],
-        limit: int
+        limit: int,
+        admit: Callable[[], ContextManager] = nullcontext
     ) -> List[Dict[str, Any]]:
         """Generate personalized recommendations based on user history"""
+        # Serve from the collaborative filtering model when it covers the request
+        candidates = []
+        if self.cf_model is not None:
+            candidates = self.offload.run(
+                'candidates',
+                len(interaction_history),
+                self.cf_model.candidates,
+                interaction_history,
+                limit
+            )
+            if len(candidates) >= limit:
+                return candidates
+        
+        user_summary = self._user_summary(preference_profile, interaction_history)
+        with admit():
+            try:
+                recommendations = None
+                if self.batcher is not None:
+                    with span('batch'):
+                        try:
+                            recommendations = self.batcher.submit((user_summary, limit, capture.current_record()))
+                        except NotBatched:
+                            pass
+                if recommendations is None:
+                    recommendations = self._generate_personalized(user_summary, limit)
+            except Exception as e:
+                recommendations = self._fallback_recommendations(preference_profile, limit)
+        
+        # Model candidates first, topped up with generated ones
+        candidate_ids = {c['content_id'] for c in candidates}
+        recommendations = candidates + [
+            r for r in recommendations if r['content_id'] not in candidate_ids
+        ]
+        return recommendations[:limit]
+    
+    def _user_summary(
+        self,
+        preference_profile: Dict[str, Any],
+        interaction_history: List[Dict[str, Any]]
+    ) -> str:
+        """Preferences and recent activity as they appear in personalized prompts"""
         favorite_types = preference_profile.get('favorite_ghost_types', [])
         preferred_content = preference_profile.get('preferred_content_types', [])
         spookiness = preference_profile.get('spookiness_level', 3)
@@ -111,89 +362,87 @@ Return ONLY a valid JSON array with no additional text."""
             for i in interaction_history[-10:]
         ]
         
-        prompt = f"""You are a paranormal content recommendation expert. Generate {limit} personalized recommendations based on:
-
-User Preferences:
+        return f"""User Preferences:
 - Favorite Ghost Types: {', '.join(favorite_types) if favorite_types else 'Various'}
 - Preferred Content: {', '.join(preferred_content) if preferred_content else 'All types'}
 - Spookiness Level: {spookiness}/5
 
 Recent Activity:
-{chr(10).join(recent_content)}
+{chr(10).join(recent_content)}"""
+    
+    def _personalized_prompt(self, user_summary: str, limit: int) -> str:
+        """Prompt for one user's personalized recommendations"""
+        return f"""You are a paranormal content recommendation expert. Generate {limit} personalized recommendations based on:
 
-Generate diverse recommendations that:
-1. Build on their recent interests
-2. Introduce new but related content
-3. Match their spookiness comfort level
-4. Include multiple content types (ghost_entity, story, movie, myth)
+{user_summary}
 
-For each recommendation, provide:
-1. content_id (generate a plausible ID)
-2. content_type (ghost_entity, story, movie, or myth)
-3. score (0.0-1.0)
-4. reasoning (brief explanation)
+Generate {PERSONALIZED_GUIDELINES}
 
 Return ONLY a valid JSON array with no additional text."""
-        
-        try:
+    
+    def _generate_personalized(self, user_summary: str, limit: int) -> List[Dict[str, Any]]:
+        """One Gemini call for one user's personalized recommendations"""
+        prompt = self._personalized_prompt(user_summary, limit)
+        with span('llm_wait', model='recommendations'):
             response = self.model.generate_content(prompt)
-            recommendations = self._parse_gemini_response(response.text)
-            return recommendations[:limit]
-        except Exception as e:
-            return self._fallback_recommendations(preference_profile, limit)
+        with span('parse'):
+            return self._parse_gemini_response(response.text)
     
-    def _ensure_diversity(self, recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Ensure recommendations include diverse content types"""
-        if not recommendations:
-            return recommendations
-        
-        # Group by content type
-        by_type = {}
-        for rec in recommendations:
-            content_type = rec.get('content_type', 'ghost_entity')
-            if content_type not in by_type:
-                by_type[content_type] = []
-            by_type[content_type].append(rec)
+    def _generate_batch(self, requests: List[Tuple[str, int, Any]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        One Gemini call for several users' personalized recommendations
         
-        # If we have good diversity (3+ types), return as is
-        if len(by_type) >= 3:
-            return recommendations
+        When traffic capture is on, each request's record gets the single-user
+        prompt and its own share of the output rather than the batched call, so
+        every captured request replays on its own.
         
-        # Otherwise, try to balance the types
-        diverse_recs = []
-        content_types = list(by_type.keys())
-        max_per_type = max(3, len(recommendations) // len(content_types))
+        Args:
+            requests: (user summary, limit, capture record or None) per user
+            
+        Returns:
+            Recommendations per request, None where the response had none for it
+        """
+        keys = [f"r{i + 1}" for i in range(len(requests))]
+        users = "\n\n".join(
+            f'User "{key}" ({limit} recommendations):\n{user_summary}'
+            for key, (user_summary, limit, _) in zip(keys, requests)
+        )
+        prompt = f"""You are a paranormal content recommendation expert. Generate personalized recommendations for each of the {len(requests)} users below.
+
+{users}
+
+For every user, generate {PERSONALIZED_GUIDELINES}
+
+Return ONLY a valid JSON object with no additional text, mapping each user key ({', '.join(f'"{key}"' for key in keys)}) to that user's JSON array of recommendations."""
         
-        for content_type in content_types:
-            diverse_recs.extend(by_type[content_type][:max_per_type])
+        start = time.perf_counter()
+        with span('llm_wait', model='recommendations', batch_size=len(requests)), capture.recording(None):
+            response = self.model.generate_content(prompt)
+        seconds = round(time.perf_counter() - start, 4)
+        with span('parse'):
+            by_key = self.offload.run('parse', len(response.text), parse_batch_recommendations, response.text, keys)
         
-        return diverse_recs
+        results = []
+        for key, (user_summary, limit, record) in zip(keys, requests):
+            recommendations = by_key[key][:limit] if key in by_key else None
+            if recommendations is not None and record is not None:
+                record.llm_calls.append({
+                    'model': getattr(self.model, 'model_name', type(self.model).__name__),
+                    'prompt': self._personalized_prompt(user_summary, limit),
+                    'output': json.dumps(recommendations),
+                    'seconds': seconds,
+                    'batch_size': len(requests),
+                })
+            results.append(recommendations)
+        return results
+    
+    def _ensure_diversity(self, recommendations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Ensure recommendations include diverse content types"""
+        return self.offload.run('diversity', len(recommendations), ensure_diversity, recommendations)
     
     def _parse_gemini_response(self, response_text: str) -> List[Dict[str, Any]]:
         """Parse Gemini API response into recommendation list"""
-        try:
-            # Remove markdown code blocks if present
-            text = response_text.strip()
-            if text.startswith('```'):
-                text = text.split('```')[1]
-                if text.startswith('json'):
-                    text = text[4:]
-            text = text.strip()
-            
-            recommendations = json.loads(text)
-            
-            # Validate structure
-            if not isinstance(recommendations, list):
-                return []
-            
-            validated = []
-            for rec in recommendations:
-                if all(key in rec for key in ['content_id', 'content_type', 'score', 'reasoning']):
-                    validated.append(rec)
-            
-            return validated
-        except json.JSONDecodeError:
-            return []
+        return self.offload.run('parse', len(response_text), parse_recommendations, response_text)
     
     def _fallback_recommendations(
         self,
@@ -224,9 +473,8 @@ Return ONLY a valid JSON array with no additional text."""
         """Invalidate recommendation cache"""
         if user_id:
             # Remove specific user's cache entries
-            keys_to_remove = [k for k in self.cache.keys() if k.startswith(user_id)]
-            for key in keys_to_remove:
-                del self.cache[key]
+            self.cache.delete_prefix(user_id)
         else:
             # Clear entire cache
             self.cache.clear()
+            self.segment_cache.clear()
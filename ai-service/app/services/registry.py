@@ -0,0 +1,98 @@
+"""Lazy, thread-safe construction of process-wide services"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+class ServiceUnavailableError(RuntimeError):
+    """Raised when a service cannot be constructed (e.g. missing configuration)"""
+
+
+class LazyService:
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        """
+        Defer building a service (and its heavy imports) until first use
+
+        Args:
+            name: Service name used in logs and readiness output
+            factory: Zero-argument callable that imports and builds the service
+        """
+        self.name = name
+        self._factory = factory
+        self._instance: Any = _UNSET
+        self._lock = threading.Lock()
+        self.last_error: Optional[str] = None
+        self.init_seconds: Optional[float] = None
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._instance is not _UNSET
+
+    def get(self) -> Any:
+        """Return the service, building it on the first call"""
+        instance = self._instance
+        if instance is not _UNSET:
+            return instance
+
+        with self._lock:
+            if self._instance is not _UNSET:
+                return self._instance
+
+            start = time.perf_counter()
+            try:
+                instance = self._factory()
+            except Exception as e:
+                # Not cached: the next call retries, e.g. after configuration is fixed
+                self.last_error = str(e)
+                logger.error(f"Failed to initialize {self.name}: {str(e)}")
+                raise ServiceUnavailableError(f"{self.name} is unavailable: {str(e)}") from e
+
+            self.init_seconds = time.perf_counter() - start
+            self.last_error = None
+            self._instance = instance
+            logger.info(f"Initialized {self.name} in {self.init_seconds * 1000:.0f}ms")
+            return instance
+
+    def status(self) -> Dict[str, Any]:
+        """Initialization state for health endpoints"""
+        if self.is_initialized:
+            return {'state': 'initialized', 'init_ms': round(self.init_seconds * 1000, 1)}
+        if self.last_error:
+            return {'state': 'failed', 'error': self.last_error}
+        return {'state': 'pending'}
+
+
+def warm_up(services, tasks=(), background: bool = True) -> Optional[threading.Thread]:
+    """
+    Build services ahead of the first request
+
+    Args:
+        services: LazyService instances to build, in order
+        tasks: Callables run after the services are built (e.g. cache warm-up)
+        background: Build on a daemon thread so startup isn't blocked
+    """
+    def run():
+        for service in services:
+            try:
+                service.get()
+            except ServiceUnavailableError:
+                pass
+        for task in tasks:
+            try:
+                task()
+            except Exception as e:
+                logger.error(f"Warm-up task {getattr(task, '__name__', task)} failed: {str(e)}")
+
+    if not background:
+        run()
+        return None
+
+    thread = threading.Thread(target=run, name='service-warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,217 @@
+"""Replay captured traffic through the services without a network
+
+Each captured request is validated and sent through RecommendationEngine or
+DigitalTwinService again. Their Gemini models are replaced by ReplayModel,
+which returns the LLM outputs recorded for that request in order. This
+benchmarks parsing, caching, diversity and serialization against real
+traffic. A request that makes more model calls than were recorded (e.g. a
+cache hit at capture time that misses now) gets an error from ReplayModel,
+and the service takes its normal fallback path.
+
+Usage:
+    uv run python -m app.services.replay captures/ [--repeat 3] [--cold] [--simulate-latency]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, Iterable, List
+
+from app.utils.capture import CaptureRecord, load_captures, replace_models
+from app.utils.tracing import end_trace, span, start_trace
+from app.utils.validation import (
+    ValidationError,
+    validate,
+    RECOMMENDATION_REQUEST_SCHEMA,
+    TWIN_MESSAGE_REQUEST_SCHEMA,
+)
+
+
+class ReplayMiss(RuntimeError):
+    """Raised when a replayed request asks for more model calls than were captured"""
+
+
+class _ReplayResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class ReplayModel:
+    def __init__(self, simulate_latency: bool = False):
+        """
+        Stand-in for a Gemini model that serves recorded outputs
+
+        Args:
+            simulate_latency: Sleep for each call's recorded latency
+        """
+        self.simulate_latency = simulate_latency
+        self._calls: List[Dict[str, Any]] = []
+        self.served = 0
+        self.misses = 0
+
+    def load(self, calls: List[Dict[str, Any]]) -> None:
+        """Queue the LLM calls captured for the next request"""
+        self._calls = list(calls)
+
+    def generate_content(self, prompt, *args, **kwargs):
+        if not self._calls:
+            self.misses += 1
+            raise ReplayMiss("No captured model output left for this request")
+        call = self._calls.pop(0)
+        if self.simulate_latency:
+            time.sleep(call.get('seconds', 0.0))
+        if 'error' in call:
+            raise RuntimeError(call['error'])
+        self.served += 1
+        return _ReplayResponse(call['output'])
+
+
+def build_services(replay_model: ReplayModel, similarity_index_dir: str = None):
+    """Build both services with every model swapped for replay_model"""
+    # Nothing reaches Gemini, but the services still expect a key to be configured
+    if not os.environ.get('GEMINI_API_KEY'):
+        os.environ['GEMINI_API_KEY'] = 'replay'
+    # Keep replays from reading or filling a shared disk cache
+    os.environ['CACHE_DIR'] = ''
+    # Batched requests were captured as single-user calls, so replay each request on its own
+    os.environ['RECOMMENDATION_BATCH_WINDOW_MS'] = '0'
+
+    from app.services.digital_twin import DigitalTwinService
+    from app.services.recommendation_engine import RecommendationEngine
+
+    similarity_index = None
+    if similarity_index_dir:
+        from app.services.similarity_index import SimilarityIndex
+        similarity_index = SimilarityIndex(similarity_index_dir)
+
+    engine = RecommendationEngine()
+    twin = DigitalTwinService(similarity_index=similarity_index)
+    replace_models(engine, lambda model: replay_model)
+    replace_models(twin, lambda model: replay_model)
+    return engine, twin
+
+
+def replay_record(captured: Dict[str, Any], engine, twin) -> CaptureRecord:
+    """Run one captured request and return a record of its per-span timings"""
+    body = captured.get('request')
+    record = CaptureRecord(captured['endpoint'], body)
+    root = start_trace(captured['endpoint'])
+    try:
+        if captured['endpoint'] == 'recommendations':
+            with span('validation'):
+                validate(body, RECOMMENDATION_REQUEST_SCHEMA)
+            recommendations = engine.generate_recommendations(
+                user_id=body['user_id'],
+                preference_profile=body.get('preference_profile') or {},
+                interaction_history=body.get('interaction_history') or [],
+                limit=body.get('limit', 10)
+            )
+            with span('serialize'):
+                record.response = json.dumps({
+                    'user_id': body['user_id'],
+                    'recommendations': recommendations,
+                    'count': len(recommendations)
+                })
+        else:
+            with span('validation'):
+                validate(body, TWIN_MESSAGE_REQUEST_SCHEMA)
+            result = twin.generate_response(
+                user_id=body['user_id'],
+                message=body['message'],
+                context=body.get('context') or {}
+            )
+            with span('serialize'):
+                record.response = json.dumps({
+                    'user_id': body['user_id'],
+                    'response': result['response'],
+                    'content_references': result['content_references'],
+                    'response_time': result['response_time']
+                })
+        record.status = 200
+    except ValidationError:
+        record.status = 400
+    finally:
+        end_trace(root)
+    record.finish()
+    record.timings = root.totals()
+    return record
+
+
+def replay(
+    captures: Iterable[Dict[str, Any]],
+    engine,
+    twin,
+    replay_model: ReplayModel,
+    cold: bool = False
+) -> List[CaptureRecord]:
+    """
+    Replay captured requests in order
+
+    Args:
+        captures: Records from load_captures()
+        engine: RecommendationEngine built by build_services()
+        twin: DigitalTwinService built by build_services()
+        replay_model: The model both services were built with
+        cold: Clear the caches before every request
+    """
+    results = []
+    for captured in captures:
+        if captured.get('endpoint') not in ('recommendations', 'twin'):
+            continue
+        if cold:
+            engine.invalidate_cache()
+            twin.response_cache.clear()
+        replay_model.load(captured.get('llm_calls', []))
+        results.append(replay_record(captured, engine, twin))
+    return results
+
+
+def summarize(results: List[CaptureRecord]) -> Dict[str, Any]:
+    """Per-endpoint latency percentiles and mean time per stage, in milliseconds"""
+    summary = {}
+    for endpoint in sorted({r.endpoint for r in results}):
+        records = [r for r in results if r.endpoint == endpoint]
+        durations = sorted(r.duration * 1000 for r in records)
+        stages = {}
+        for r in records:
+            for name, seconds in r.timings.items():
+                stages.setdefault(name, []).append(seconds * 1000)
+        summary[endpoint] = {
+            'requests': len(records),
+            'invalid': sum(1 for r in records if r.status == 400),
+            'p50_ms': round(statistics.median(durations), 3),
+            'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3),
+            'stage_mean_ms': {
+                name: round(sum(values) / len(records), 3) for name, values in sorted(stages.items())
+            },
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay captured traffic with recorded LLM outputs')
+    parser.add_argument('captures', help='Capture directory (CAPTURE_DIR) or a single capture-*.jsonl.gz file')
+    parser.add_argument('--repeat', type=int, default=1, help='Replay the whole capture this many times')
+    parser.add_argument('--cold', action='store_true', help='Clear caches before every request')
+    parser.add_argument('--simulate-latency', action='store_true', help='Sleep for recorded LLM latency')
+    parser.add_argument('--similarity-index-dir', help='Similarity index used for twin grounding')
+    args = parser.parse_args()
+
+    captured = list(load_captures(args.captures))
+    replay_model = ReplayModel(simulate_latency=args.simulate_latency)
+    engine, twin = build_services(replay_model, args.similarity_index_dir)
+
+    start = time.time()
+    results = []
+    for _ in range(args.repeat):
+        results.extend(replay(captured, engine, twin, replay_model, cold=args.cold))
+    elapsed = time.time() - start
+
+    print(json.dumps(summarize(results), indent=2))
+    print(f"Replayed {len(results)} requests in {elapsed:.2f}s "
+          f"({replay_model.served} recorded model outputs, {replay_model.misses} misses)")
+
+
+if __name__ == '__main__':
+    main()
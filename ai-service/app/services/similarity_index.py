@@ -0,0 +1,381 @@
+"""Local vector index over catalog descriptions for "more like this" search"""
+import argparse
+import re
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from app.utils.artifacts import Artifact, ArtifactStore, lookup_ids, publish_artifact, sorted_id_arrays
+from app.utils.exports import load_records
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset("""
+a an and are as at be by for from has have he her his in is it its of on or she
+that the their them they this to was were which who will with about into than
+then there these those what when where how can you your me my tell show any
+""".split())
+
+# Catalog rows may use either column for the display name
+TITLE_FIELDS = ('title', 'name')
+TEXT_FIELDS = ('title', 'name', 'type', 'origin', 'cultural_context', 'description', 'tags')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stop words"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if len(t) > 1 and t not in STOP_WORDS]
+
+
+def _row_text(row: Dict[str, Any]) -> str:
+    parts = []
+    for field in TEXT_FIELDS:
+        value = row.get(field)
+        if isinstance(value, (list, tuple)):
+            parts.extend(str(v) for v in value)
+        elif value:
+            parts.append(str(value))
+    return ' '.join(parts)
+
+
+def _row_title(row: Dict[str, Any]) -> str:
+    for field in TITLE_FIELDS:
+        if row.get(field):
+            return str(row[field])
+    return ''
+
+
+def _csr_dot(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, dense: np.ndarray) -> np.ndarray:
+    """Sparse (CSR) x dense product"""
+    out = np.zeros((len(indptr) - 1, dense.shape[1]))
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    np.add.at(out, rows, data[:, None] * dense[indices])
+    return out
+
+
+def _csr_t_dot(indptr: np.ndarray, indices: np.ndarray, data: np.ndarray, dense: np.ndarray, n_cols: int) -> np.ndarray:
+    """Transposed sparse (CSR) x dense product"""
+    out = np.zeros((n_cols, dense.shape[1]))
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    np.add.at(out, indices, data[:, None] * dense[rows])
+    return out
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_clusters: int, iterations: int, rng) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity; returns unit centroids"""
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(n_clusters):
+            members = vectors[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters from a random item
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+    return centroids
+
+
+def build_similarity_index(
+    catalog: List[Dict[str, Any]],
+    output_dir: str,
+    dims: int = 64,
+    max_features: int = 20000,
+    n_lists: Optional[int] = None,
+    seed: int = 42
+) -> str:
+    """
+    Embed catalog descriptions with TF-IDF + truncated SVD and publish the index
+
+    Args:
+        catalog: Catalog rows with id, content_type, title/name and description
+        output_dir: Artifact root; each build is published as a new version
+        dims: Embedding dimensions (LSA components)
+        max_features: Vocabulary size cap, most frequent terms first
+        n_lists: IVF cluster count (defaults to sqrt of the catalog size)
+        seed: Seed for the randomized SVD and clustering
+
+    Returns:
+        The version name that was published
+    """
+    rng = np.random.default_rng(seed)
+    rows = [r for r in catalog if r.get('id') and r.get('content_type')]
+    docs = [tokenize(_row_text(r)) for r in rows]
+
+    # Vocabulary by document frequency
+    doc_freq: Dict[str, int] = {}
+    for tokens in docs:
+        for token in set(tokens):
+            doc_freq[token] = doc_freq.get(token, 0) + 1
+    vocabulary = sorted(doc_freq, key=lambda t: (-doc_freq[t], t))[:max_features]
+    term_index = {term: i for i, term in enumerate(vocabulary)}
+    idf = np.log((1 + len(docs)) / (1 + np.array([doc_freq[t] for t in vocabulary], dtype=np.float64))) + 1
+
+    # Sublinear TF-IDF rows, L2 normalized, in CSR form
+    indptr, indices, data = [0], [], []
+    for tokens in docs:
+        counts: Dict[int, int] = {}
+        for token in tokens:
+            if token in term_index:
+                counts[term_index[token]] = counts.get(term_index[token], 0) + 1
+        cols = np.array(sorted(counts), dtype=np.int64)
+        weights = (1 + np.log([counts[c] for c in cols])) * idf[cols] if len(cols) else np.zeros(0)
+        norm = np.linalg.norm(weights)
+        indices.extend(cols)
+        data.extend(weights / norm if norm else weights)
+        indptr.append(len(indices))
+    indptr = np.array(indptr, dtype=np.int64)
+    indices = np.array(indices, dtype=np.int64)
+    data = np.array(data, dtype=np.float64)
+
+    # Randomized truncated SVD (Halko et al.) using sparse products only
+    n_docs, n_terms = len(docs), len(vocabulary)
+    rank = max(1, min(dims, n_docs, n_terms))
+    if n_docs and n_terms:
+        sketch = _csr_dot(indptr, indices, data, rng.standard_normal((n_terms, rank + 10)))
+        for _ in range(2):
+            sketch, _ = np.linalg.qr(sketch)
+            sketch = _csr_dot(indptr, indices, data, _csr_t_dot(indptr, indices, data, sketch, n_terms))
+        basis, _ = np.linalg.qr(sketch)
+        small = _csr_t_dot(indptr, indices, data, basis, n_terms).T
+        _, _, vt = np.linalg.svd(small, full_matrices=False)
+        projection = vt[:rank].T
+    else:
+        projection = np.zeros((n_terms, rank))
+
+    embeddings = _csr_dot(indptr, indices, data, projection)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+
+    # Inverted file lists for approximate search
+    if n_lists is None:
+        n_lists = int(np.sqrt(n_docs))
+    n_lists = max(1, min(n_lists, n_docs))
+    if n_docs:
+        centroids = _spherical_kmeans(embeddings, n_lists, 10, rng)
+        assignment = np.argmax(embeddings @ centroids.T, axis=1)
+    else:
+        centroids = np.zeros((n_lists, rank))
+        assignment = np.zeros(0, dtype=np.int64)
+    list_items = np.argsort(assignment, kind='stable').astype(np.int32)
+    list_ptr = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=n_lists)))).astype(np.int64)
+
+    content_types = sorted({str(r['content_type']) for r in rows})
+    type_codes = {content_type: code for code, content_type in enumerate(content_types)}
+    item_ids = np.array([str(r['id']) for r in rows], dtype=str)
+    terms = np.array(vocabulary, dtype=str)
+    term_order = np.argsort(terms, kind='stable').astype(np.int32)
+
+    return publish_artifact(
+        output_dir,
+        arrays={
+            'embeddings': embeddings.astype(np.float32),
+            'item_ids': item_ids,
+            'item_types': np.array([type_codes[str(r['content_type'])] for r in rows], dtype=np.uint8),
+            'titles': np.array([_row_title(r) for r in rows], dtype=str),
+            'image_urls': np.array([str(r.get('image_url') or '') for r in rows], dtype=str),
+            'terms': terms[term_order],
+            'term_idf': idf[term_order].astype(np.float32),
+            'term_projection': projection[term_order].astype(np.float32),
+            'centroids': centroids.astype(np.float32),
+            'list_ptr': list_ptr,
+            'list_items': list_items,
+            **sorted_id_arrays(item_ids),
+        },
+        metadata={
+            'kind': 'similarity_index',
+            'content_types': content_types,
+            'dims': rank,
+            'items': n_docs,
+        }
+    )
+
+
+class SimilarityIndex:
+    def __init__(self, index_dir: str, check_interval: float = 30.0, default_nprobe: int = 8):
+        """
+        Search a memory-mapped catalog embedding index
+
+        Args:
+            index_dir: Artifact root written by build_similarity_index
+            check_interval: Seconds between checks for a newly published version
+            default_nprobe: IVF lists scanned by approximate search
+        """
+        self.store = ArtifactStore(index_dir, check_interval=check_interval)
+        self.store.refresh(force=True)
+        self.default_nprobe = default_nprobe
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.store.version
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.store.version is not None
+
+    def embed_text(self, text: str) -> Optional[np.ndarray]:
+        """Project free text into the index's embedding space"""
+        artifact = self.store.current()
+        if artifact is None:
+            return None
+        return self._embed_text(artifact, text)
+
+    def _embed_text(self, artifact: Artifact, text: str) -> Optional[np.ndarray]:
+        counts: Dict[str, int] = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        if not counts:
+            return None
+
+        terms = artifact['terms']
+        if len(terms) == 0:
+            return None
+        keys = np.array(list(counts), dtype=str)
+        positions = np.minimum(np.searchsorted(terms, keys), len(terms) - 1)
+        known = terms[positions] == keys
+        if not known.any():
+            return None
+
+        positions = positions[known]
+        tf = 1 + np.log(np.array([counts[k] for k in keys[known]], dtype=np.float32))
+        weights = tf * artifact['term_idf'][positions]
+        vector = weights @ artifact['term_projection'][positions]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        approximate: bool = False,
+        nprobe: Optional[int] = None,
+        exclude: Optional[List[int]] = None
+    ) -> List[tuple]:
+        """
+        Return (row, score) pairs for the k nearest catalog items
+
+        Args:
+            query: Unit query vector
+            k: Number of results
+            approximate: Scan only the nprobe closest IVF lists instead of every item
+            nprobe: IVF lists to scan (defaults to default_nprobe)
+            exclude: Rows to leave out of the results
+        """
+        artifact = self.store.current()
+        if artifact is None:
+            return []
+        return self._search(artifact, query, k, approximate, nprobe, exclude)
+
+    def _search(
+        self,
+        artifact: Artifact,
+        query: Optional[np.ndarray],
+        k: int,
+        approximate: bool,
+        nprobe: Optional[int] = None,
+        exclude: Optional[List[int]] = None
+    ) -> List[tuple]:
+        if query is None:
+            return []
+
+        embeddings = artifact['embeddings']
+        if approximate:
+            list_ptr = artifact['list_ptr']
+            centroid_scores = artifact['centroids'] @ query
+            probes = min(nprobe or self.default_nprobe, len(centroid_scores))
+            lists = np.argpartition(-centroid_scores, probes - 1)[:probes]
+            candidates = np.concatenate([
+                artifact['list_items'][list_ptr[c]:list_ptr[c + 1]] for c in lists
+            ])
+            scores = embeddings[candidates] @ query
+        else:
+            candidates = None
+            scores = embeddings @ query
+
+        if exclude:
+            rows = candidates if candidates is not None else np.arange(len(scores))
+            scores = np.where(np.isin(rows, exclude), -np.inf, scores)
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top = top[np.isfinite(scores[top])]
+        rows = candidates[top] if candidates is not None else top
+        return [(int(row), float(scores[i])) for row, i in zip(rows, top)]
+
+    def _describe(self, artifact: Artifact, row: int, score: Optional[float] = None) -> Dict[str, Any]:
+        """Catalog fields for one index row"""
+        item = {
+            'content_id': str(artifact['item_ids'][row]),
+            'content_type': artifact.metadata['content_types'][artifact['item_types'][row]],
+            'title': str(artifact['titles'][row]),
+        }
+        image_url = str(artifact['image_urls'][row])
+        if image_url:
+            item['image_url'] = image_url
+        if score is not None:
+            item['score'] = round(score, 4)
+        return item
+
+    def lookup(self, content_ids: List[str]) -> Optional[List[Optional[Dict[str, Any]]]]:
+        """
+        Catalog fields for a batch of IDs in one pass
+
+        Returns:
+            One item per ID (None for IDs not in the catalog), or None when no index is loaded
+        """
+        artifact = self.store.current()
+        if artifact is None:
+            return None
+        rows = lookup_ids(artifact, content_ids)
+        return [self._describe(artifact, int(row)) if row >= 0 else None for row in rows]
+
+    def nearby_ids(self, content_id: str, window: int = 3) -> List[str]:
+        """Catalog IDs sorting next to content_id, i.e. sharing most of its prefix"""
+        artifact = self.store.current()
+        if artifact is None or len(artifact['sorted_ids']) == 0:
+            return []
+        sorted_ids = artifact['sorted_ids']
+        position = int(np.searchsorted(sorted_ids, content_id))
+        return [str(item_id) for item_id in sorted_ids[max(0, position - window):position + window]]
+
+    def similar_to_item(self, content_id: str, k: int = 10, approximate: bool = False) -> List[Dict[str, Any]]:
+        """Items whose descriptions are closest to the given item's"""
+        artifact = self.store.current()
+        if artifact is None:
+            return []
+        row = int(lookup_ids(artifact, [content_id])[0])
+        if row < 0:
+            return []
+        query = np.asarray(artifact['embeddings'][row])
+        results = self._search(artifact, query, k, approximate, exclude=[row])
+        return [self._describe(artifact, r, s) for r, s in results]
+
+    def similar_to_text(self, text: str, k: int = 10, approximate: bool = False) -> List[Dict[str, Any]]:
+        """Items whose descriptions are closest to free text"""
+        artifact = self.store.current()
+        if artifact is None:
+            return []
+        results = self._search(artifact, self._embed_text(artifact, text), k, approximate)
+        return [self._describe(artifact, r, s) for r, s in results if s > 0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the catalog similarity index from a catalog export')
+    parser.add_argument('input', help='CSV, JSON(L) or Parquet export with id, content_type, title/name, description')
+    parser.add_argument('output', help='Index directory (e.g. the SIMILARITY_INDEX_DIR used by the service)')
+    parser.add_argument('--dims', type=int, default=64, help='Embedding dimensions')
+    parser.add_argument('--lists', type=int, default=None, help='IVF lists (default: sqrt of catalog size)')
+    args = parser.parse_args()
+
+    start = time.time()
+    catalog = load_records(args.input)
+    version = build_similarity_index(catalog, args.output, dims=args.dims, n_lists=args.lists)
+    print(f"Built {version} from {len(catalog)} catalog items in {time.time() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Cheap message classification and per-tier metrics for digital twin routing"""
+import re
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+# Tiers, cheapest first
+TIER_TEMPLATE = 'template'
+TIER_FAST = 'fast'
+TIER_FULL = 'full'
+
+_GREETING = re.compile(
+    r"^(hi|hello|hey|hiya|howdy|greetings|good (morning|afternoon|evening))( there| twin| friend)?$"
+)
+_THANKS = re.compile(r"^(thanks|thank you|thank you so much|thanks a lot|thx|ty|cheers)( twin| friend)?$")
+_FAREWELL = re.compile(r"^(bye|goodbye|good night|goodnight|see you|see ya|farewell)( later| soon| twin)?$")
+_HELP = re.compile(r"^(help|what can you do|who are you|what are you)$")
+# Definition-style questions only; "describe ..." and "tell me about ..." ask
+# for open-ended answers and stay on the full model
+_LOOKUP = re.compile(
+    r"^(what|who) (is|are) (an? |the )?(?P<subject>[a-z0-9' -]{2,60})$"
+    r"|^define (an? |the )?(?P<subject2>[a-z0-9' -]{2,60})$"
+)
+_PRONOUNS = frozenset({'it', 'that', 'this', 'they', 'them', 'those', 'these', 'he', 'she', 'one'})
+
+
+def _normalize(message: str) -> str:
+    text = re.sub(r"[^\w' -]+", ' ', message.lower())
+    return re.sub(r"\s+", ' ', text).strip()
+
+
+def classify_message(message: str) -> Dict[str, Any]:
+    """
+    Classify a twin message with local heuristics
+
+    Returns:
+        {'intent': ..., 'tier': ..., 'subject': optional lookup subject}
+    """
+    text = _normalize(message)
+
+    for intent, pattern in (
+        ('greeting', _GREETING),
+        ('thanks', _THANKS),
+        ('farewell', _FAREWELL),
+        ('help', _HELP),
+    ):
+        if pattern.match(text):
+            return {'intent': intent, 'tier': TIER_TEMPLATE}
+
+    match = _LOOKUP.match(text)
+    if match and '?' not in message.rstrip()[:-1] and len(text.split()) <= 10:
+        subject = (match.group('subject') or match.group('subject2')).strip()
+        # "what is it?" depends on the conversation, so it needs the full model
+        if subject.split()[0] not in _PRONOUNS:
+            return {'intent': 'lookup', 'tier': TIER_FAST, 'subject': subject}
+
+    return {'intent': 'open', 'tier': TIER_FULL}
+
+
+class RoutingStats:
+    def __init__(self, window: int = 500):
+        """
+        Track routing decisions and per-tier latency
+
+        Args:
+            window: Recent latencies kept per tier for percentiles
+        """
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._intents: Dict[str, int] = {}
+        self._latencies: Dict[str, deque] = {}
+        self._window = window
+
+    def record(self, intent: str, tier: str, latency: float) -> None:
+        with self._lock:
+            self._counts[tier] = self._counts.get(tier, 0) + 1
+            self._intents[intent] = self._intents.get(intent, 0) + 1
+            self._latencies.setdefault(tier, deque(maxlen=self._window)).append(latency)
+
+    @staticmethod
+    def _percentile(values, p: float) -> Optional[float]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests_by_tier': dict(self._counts),
+                'requests_by_intent': dict(self._intents),
+                'latency_ms': {
+                    tier: {
+                        'p50': round(self._percentile(values, 0.5) * 1000, 1),
+                        'p95': round(self._percentile(values, 0.95) * 1000, 1),
+                        'samples': len(values),
+                    }
+                    for tier, values in self._latencies.items() if values
+                },
+            }
@@ -1,5 +1,6 @@
 """Utility functions for AI service"""
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,3 +21,108 @@ def get_flask_config() -> dict:
         'port': int(os.getenv('FLASK_PORT', 5001)),
         'debug': os.getenv('FLASK_ENV', 'development') == 'development'
     }
+
+
+def get_max_request_bytes() -> int:
+    """Get the maximum accepted request body size in bytes"""
+    return int(os.getenv('MAX_REQUEST_BYTES', 256 * 1024))
+
+
+def get_warm_services() -> bool:
+    """Whether to build services in the background at startup instead of on first request"""
+    return os.getenv('WARM_SERVICES', 'false').lower() in ('1', 'true', 'yes')
+
+
+def get_admin_token() -> Optional[str]:
+    """Get the token required by the /admin endpoints; they are disabled when unset"""
+    return os.getenv('ADMIN_TOKEN') or None
+
+
+def get_segment_profiles_path() -> Optional[str]:
+    """Get the preference profile export used to warm the cold-start segment cache"""
+    return os.getenv('SEGMENT_PROFILES_PATH') or None
+
+
+def get_segment_warm_count() -> int:
+    """Get the number of most common profile segments precomputed at startup"""
+    return int(os.getenv('SEGMENT_WARM_COUNT', 20))
+
+
+def get_admission_config() -> dict:
+    """Get admission control limits for the LLM-backed endpoints"""
+    return {
+        'max_concurrent': int(os.getenv('ADMISSION_MAX_CONCURRENT', 8)),
+        'max_queue': int(os.getenv('ADMISSION_MAX_QUEUE', 16)),
+        'default_budget_ms': int(os.getenv('ADMISSION_DEFAULT_BUDGET_MS', 3000)),
+    }
+
+
+def get_twin_model_config() -> dict:
+    """Get digital twin model tiers and whether routing between them is enabled"""
+    return {
+        'full_model': os.getenv('TWIN_FULL_MODEL', 'gemini-pro'),
+        'fast_model': os.getenv('TWIN_FAST_MODEL', 'gemini-1.5-flash'),
+        'routing': os.getenv('TWIN_ROUTING', 'true').lower() in ('1', 'true', 'yes'),
+    }
+
+
+def get_cache_config() -> dict:
+    """Get sizes and location of the recommendation and twin response caches"""
+    return {
+        'disk_dir': os.getenv('CACHE_DIR') or None,
+        'memory_items': int(os.getenv('CACHE_MEMORY_ITEMS', 1000)),
+        'ttl': int(os.getenv('CACHE_TTL_SECONDS', 3600)),
+        'disk_max_bytes': int(os.getenv('CACHE_DISK_MAX_MB', 256)) * 1024 * 1024,
+        'compaction_interval': int(os.getenv('CACHE_COMPACTION_SECONDS', 300)),
+    }
+
+
+def get_capture_config() -> dict:
+    """Get traffic capture settings; capture is off unless CAPTURE_DIR is set"""
+    return {
+        'directory': os.getenv('CAPTURE_DIR') or None,
+        'sample_rate': float(os.getenv('CAPTURE_SAMPLE_RATE', 0.01)),
+        'max_bytes': int(os.getenv('CAPTURE_MAX_MB', 50)) * 1024 * 1024,
+        'backups': int(os.getenv('CAPTURE_BACKUPS', 10)),
+        'salt': os.getenv('CAPTURE_SALT') or None,
+    }
+
+
+def get_flight_recorder_config() -> dict:
+    """Get the request flight recorder size and slow-request threshold"""
+    return {
+        'capacity': int(os.getenv('FLIGHT_RECORDER_SIZE', 200)),
+        'slow_threshold': int(os.getenv('SLOW_REQUEST_MS', 2000)) / 1000,
+    }
+
+
+def get_offload_config() -> dict:
+    """Get the execution backend and per-stage offload thresholds for CPU-bound recommendation stages"""
+    thresholds = {}
+    for stage in ('parse', 'diversity', 'candidates'):
+        value = os.getenv(f'OFFLOAD_THRESHOLD_{stage.upper()}')
+        if value:
+            thresholds[stage] = int(value)
+    return {
+        'backend': os.getenv('OFFLOAD_BACKEND', 'inline'),
+        'workers': int(os.getenv('OFFLOAD_WORKERS', 0)) or None,
+        'thresholds': thresholds,
+    }
+
+
+def get_batching_config() -> dict:
+    """Get the micro-batching settings for personalized recommendation prompts"""
+    return {
+        'window': float(os.getenv('RECOMMENDATION_BATCH_WINDOW_MS', 0)) / 1000,
+        'max_size': int(os.getenv('RECOMMENDATION_BATCH_SIZE', 8)),
+    }
+
+
+def get_cf_model_dir() -> Optional[str]:
+    """Get the collaborative filtering model directory, if one is configured"""
+    return os.getenv('CF_MODEL_DIR') or None
+
+
+def get_similarity_index_dir() -> Optional[str]:
+    """Get the catalog similarity index directory, if one is configured"""
+    return os.getenv('SIMILARITY_INDEX_DIR') or None
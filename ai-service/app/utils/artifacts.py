@@ -0,0 +1,280 @@
+"""Versioned, memory-mapped artifact storage shared across worker processes
+
+An artifact root looks like::
+
+    models/cf/
+        CURRENT                  <- name of the published version
+        v20240101120000/
+            manifest.json        <- format, metadata, dtype/shape/crc32 per array
+            neighbors.npy
+            scores.npy
+
+Arrays are plain ``.npy`` files opened with ``mmap_mode='r'``, so every worker
+maps the same read-only pages from the OS page cache instead of holding its
+own copy. Publishing writes a complete version directory first and then
+replaces ``CURRENT`` atomically; readers pick it up on their next check.
+"""
+import json
+import logging
+import mmap
+import os
+import shutil
+import threading
+import time
+import zlib
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactError(ValueError):
+    """Raised when an artifact version is missing, incomplete or corrupt"""
+
+
+def _file_crc32(path: str) -> int:
+    """Checksum a file through a read-only mapping (no heap copy)"""
+    if os.path.getsize(path) == 0:
+        return 0
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return zlib.crc32(mapped)
+
+
+def _fsync_path(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def publish_artifact(
+    root: str,
+    arrays: Dict[str, np.ndarray],
+    metadata: Optional[Dict[str, Any]] = None,
+    keep: int = 3
+) -> str:
+    """
+    Write a new artifact version and make it current
+
+    Args:
+        root: Artifact root directory
+        arrays: Named arrays to store; object dtypes are not allowed
+        metadata: Small JSON-serializable metadata kept in the manifest
+        keep: Number of versions to retain (older ones are removed)
+
+    Returns:
+        The published version name
+    """
+    os.makedirs(root, exist_ok=True)
+    version = time.strftime('v%Y%m%d%H%M%S')
+    suffix = 1
+    while os.path.exists(os.path.join(root, version)):
+        version = f"{time.strftime('v%Y%m%d%H%M%S')}_{suffix}"
+        suffix += 1
+
+    staging_dir = os.path.join(root, f".tmp-{version}-{os.getpid()}")
+    os.makedirs(staging_dir)
+
+    manifest = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'created_at': time.time(),
+        'metadata': metadata or {},
+        'arrays': {}
+    }
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise ArtifactError(f"Array '{name}' has an object dtype and cannot be memory-mapped")
+        filename = f"{name}.npy"
+        path = os.path.join(staging_dir, filename)
+        np.save(path, array, allow_pickle=False)
+        _fsync_path(path)
+        manifest['arrays'][name] = {
+            'file': filename,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape),
+            'crc32': _file_crc32(path)
+        }
+
+    manifest_path = os.path.join(staging_dir, MANIFEST_FILE)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.rename(staging_dir, os.path.join(root, version))
+
+    tmp_path = os.path.join(root, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+    _prune_versions(root, keep)
+    return version
+
+
+def sorted_id_arrays(item_ids: np.ndarray) -> Dict[str, np.ndarray]:
+    """Build the 'sorted_ids'/'sorted_index' pair used by lookup_ids"""
+    order = np.argsort(item_ids, kind='stable').astype(np.int32)
+    return {'sorted_ids': item_ids[order], 'sorted_index': order}
+
+
+def lookup_ids(artifact: 'Artifact', content_ids: List[str]) -> np.ndarray:
+    """
+    Map content IDs to row indices (-1 when unknown)
+
+    Uses binary search over the mapped 'sorted_ids' array so workers don't
+    each build an ID dictionary for the whole catalog.
+    """
+    sorted_ids = artifact['sorted_ids']
+    if not content_ids or len(sorted_ids) == 0:
+        return np.full(len(content_ids), -1, dtype=np.int64)
+
+    keys = np.array(content_ids, dtype=str)
+    positions = np.minimum(np.searchsorted(sorted_ids, keys), len(sorted_ids) - 1)
+    found = sorted_ids[positions] == keys
+    return np.where(found, artifact['sorted_index'][positions], -1)
+
+
+def _version_key(name: str):
+    """Publish order of a version name: v<timestamp> or v<timestamp>_<n> for same-second builds"""
+    timestamp, _, suffix = name[1:].partition('_')
+    return (timestamp, int(suffix) if suffix.isdigit() else 0)
+
+
+def _prune_versions(root: str, keep: int) -> None:
+    """Remove old versions; mapped files stay valid for readers until unmapped"""
+    versions = sorted(
+        (
+            name for name in os.listdir(root)
+            if name.startswith('v') and os.path.isdir(os.path.join(root, name))
+        ),
+        key=_version_key
+    )
+    current = read_current_version(root)
+    for name in versions[:-keep] if keep > 0 else []:
+        if name != current:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def read_current_version(root: str) -> Optional[str]:
+    """Return the published version name, or None if nothing is published"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class Artifact:
+    def __init__(self, root: str, version: str, verify: bool = True):
+        """
+        Map one artifact version read-only
+
+        Args:
+            root: Artifact root directory
+            version: Version directory name
+            verify: Check each file's CRC32 against the manifest
+        """
+        self.version = version
+        self.path = os.path.join(root, version)
+
+        try:
+            with open(os.path.join(self.path, MANIFEST_FILE), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ArtifactError(f"Cannot read manifest for {version}: {e}")
+
+        if not isinstance(manifest, dict) or manifest.get('format') != FORMAT_VERSION:
+            format_version = manifest.get('format') if isinstance(manifest, dict) else None
+            raise ArtifactError(f"Unsupported artifact format {format_version} in {version}")
+
+        self.metadata = manifest.get('metadata', {})
+        self.created_at = manifest.get('created_at')
+        self.arrays: Dict[str, np.ndarray] = {}
+
+        try:
+            for name, spec in manifest['arrays'].items():
+                path = os.path.join(self.path, spec['file'])
+                if verify and _file_crc32(path) != spec['crc32']:
+                    raise ArtifactError(f"Checksum mismatch for '{name}' in {version}")
+
+                array = np.load(path, mmap_mode='r', allow_pickle=False)
+                if array.dtype.str != spec['dtype'] or list(array.shape) != spec['shape']:
+                    raise ArtifactError(f"Header mismatch for '{name}' in {version}")
+                self.arrays[name] = array
+        except ArtifactError:
+            raise
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            # Malformed manifest entries or .npy headers; callers only handle ArtifactError
+            raise ArtifactError(f"Malformed artifact {version}: {type(e).__name__}: {e}") from e
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.arrays
+
+
+class ArtifactStore:
+    def __init__(self, root: str, check_interval: float = 30.0, verify: bool = True):
+        """
+        Track the current version of an artifact root
+
+        Args:
+            root: Artifact root directory
+            check_interval: Seconds between checks of the CURRENT pointer
+            verify: Verify checksums when mapping a new version
+        """
+        self.root = root
+        self.check_interval = check_interval
+        self.verify = verify
+        self._artifact: Optional[Artifact] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> Optional[str]:
+        artifact = self._artifact
+        return artifact.version if artifact else None
+
+    def current(self) -> Optional[Artifact]:
+        """Return the current artifact, swapping in a newer version if published"""
+        self.refresh()
+        return self._artifact
+
+    def refresh(self, force: bool = False) -> bool:
+        """Map a newly published version; returns True if a swap happened"""
+        now = time.monotonic()
+        if not force and self._last_check and now - self._last_check < self.check_interval:
+            return False
+
+        with self._lock:
+            if not force and self._last_check and now - self._last_check < self.check_interval:
+                return False
+            self._last_check = now
+
+            version = read_current_version(self.root)
+            if version is None or version == self.version:
+                return False
+
+            # Keep serving the previous version if the new one is unusable
+            try:
+                artifact = Artifact(self.root, version, verify=self.verify)
+            except (ArtifactError, OSError) as e:
+                logger.error(f"Failed to load artifact {self.root}/{version}: {str(e)}")
+                return False
+
+            self._artifact = artifact
+            logger.info(f"Loaded artifact {self.root}/{version}")
+            return True
@@ -0,0 +1,256 @@
+"""Two-tier cache: a bounded in-memory LRU in front of a compressed SQLite store
+
+Values must be JSON-serializable. Every set() is written through to disk,
+so entries evicted from memory, entries written by other workers, and
+entries from before a restart are still served (and promoted back into
+memory) on the next get(). Disk values are zlib-compressed, or zstd when
+the ``zstandard`` package is installed. A background thread deletes expired
+rows and trims the store to its size cap.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+_CODEC_ZLIB = b'z'
+_CODEC_ZSTD = b's'
+
+_MISSING = object()
+
+
+def _compress(data: bytes) -> bytes:
+    if zstandard is not None:
+        return _CODEC_ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
+    return _CODEC_ZLIB + zlib.compress(data, 6)
+
+
+def _decompress(blob: bytes) -> bytes:
+    codec, payload = blob[:1], blob[1:]
+    if codec == _CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstandard is required to read this cache entry")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+class TieredCache:
+    def __init__(
+        self,
+        name: str,
+        disk_dir: Optional[str] = None,
+        memory_items: int = 1000,
+        ttl: float = 3600,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+        compaction_interval: float = 300
+    ):
+        """
+        Args:
+            name: Cache name; also the SQLite file name inside disk_dir
+            disk_dir: Directory for the disk tier (memory only when None)
+            memory_items: Entries kept in the memory tier
+            ttl: Seconds an entry stays valid in either tier
+            disk_max_bytes: Compressed bytes kept on disk before the oldest are dropped
+            compaction_interval: Seconds between background compaction runs
+        """
+        self.name = name
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.disk_max_bytes = disk_max_bytes
+        self.compaction_interval = compaction_interval
+
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'disk_errors': 0}
+
+        self.disk_path = os.path.join(disk_dir, f"{name}.sqlite3") if disk_dir else None
+        self._local = threading.local()
+        self._compactor_pid = None
+        if self.disk_path:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._connect().execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connect().execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+
+    # Disk tier
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread (and per process after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.disk_path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_compactor(self) -> None:
+        # Started lazily so each forked worker gets its own thread
+        if self._compactor_pid == os.getpid() or not self.compaction_interval:
+            return
+        self._compactor_pid = os.getpid()
+        thread = threading.Thread(target=self._compaction_loop, name=f"cache-compact-{self.name}", daemon=True)
+        thread.start()
+
+    def _compaction_loop(self) -> None:
+        while True:
+            time.sleep(self.compaction_interval)
+            try:
+                self.compact()
+            except sqlite3.Error as e:
+                logger.error(f"Cache {self.name} compaction failed: {str(e)}")
+
+    def compact(self) -> Dict[str, int]:
+        """Delete expired rows and trim the disk tier to its size cap"""
+        if not self.disk_path:
+            return {'expired': 0, 'trimmed': 0}
+
+        conn = self._connect()
+        expired = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+        trimmed = 0
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total > self.disk_max_bytes:
+            # Drop least recently used rows until 90% of the cap
+            excess = total - int(self.disk_max_bytes * 0.9)
+            rows = conn.execute("SELECT key, size FROM cache ORDER BY accessed_at").fetchall()
+            doomed = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                doomed.append((key,))
+                excess -= size
+            conn.executemany("DELETE FROM cache WHERE key = ?", doomed)
+            trimmed = len(doomed)
+
+        if expired or trimmed:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {'expired': expired, 'trimmed': trimmed}
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            return json.loads(_decompress(row[0])), row[1]
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            self._stats['disk_errors'] += 1
+            logger.error(f"Cache {self.name} disk read failed: {str(e)}")
+            return None
+
+    def _disk_set(self, key: str, value: Any, expires_at: float) -> None:
+        try:
+            blob = _compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+            self._connect().execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), expires_at, time.time())
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self._stats['disk_errors'] += 1
+            logger.error(f"Cache {self.name} disk write failed: {str(e)}")
+
+    def _disk_delete(self, sql: str, params: tuple = ()) -> None:
+        try:
+            self._connect().execute(sql, params)
+        except sqlite3.Error as e:
+            self._stats['disk_errors'] += 1
+            logger.error(f"Cache {self.name} disk delete failed: {str(e)}")
+
+    # Public API
+
+    def _remember(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return a cached value from memory, then disk, or default"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return entry[0]
+                del self._memory[key]
+
+        if self.disk_path:
+            self._ensure_compactor()
+            entry = self._disk_get(key)
+            if entry is not None:
+                self._stats['disk_hits'] += 1
+                self._remember(key, entry[0], entry[1])
+                return entry[0]
+
+        self._stats['misses'] += 1
+        return default
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value in both tiers"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._remember(key, value, expires_at)
+        if self.disk_path:
+            self._ensure_compactor()
+            self._disk_set(key, value, expires_at)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.disk_path:
+            self._disk_delete("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str) -> None:
+        """Delete every key starting with prefix"""
+        with self._lock:
+            for key in [k for k in self._memory if k.startswith(prefix)]:
+                del self._memory[key]
+        if self.disk_path:
+            # Case-sensitive like the memory tier; LIKE ignores ASCII case
+            self._disk_delete("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.disk_path:
+            self._disk_delete("DELETE FROM cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit counts and tier sizes"""
+        stats = dict(self._stats, memory_entries=len(self._memory))
+        if self.disk_path:
+            try:
+                count, size = self._connect().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+                ).fetchone()
+                stats.update(disk_entries=count, disk_bytes=size)
+            except sqlite3.Error:
+                pass
+        return stats
+
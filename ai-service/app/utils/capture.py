@@ -0,0 +1,307 @@
+"""Opt-in capture of sampled production traffic for offline replay
+
+A sampled request is recorded as one JSON line: the request body, every LLM
+prompt and output (with the call's latency), time per span name from the
+request's trace (see app/utils/tracing.py), and the response. Records are redacted before they are written. User IDs are replaced
+with keyed pseudonyms, and email addresses, phone numbers and long digit runs
+are masked in free text. Lines are appended to gzip files that rotate by size,
+and only the newest few are kept.
+"""
+import atexit
+import glob
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional['CaptureRecord']] = ContextVar('capture_record', default=None)
+
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+(\.[\w-]+)+")
+_PHONE = re.compile(r"(?<![\w-])\+?(\d{1,3}[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}(?![\w-])")
+_LONG_NUMBER = re.compile(r"(?<!\w)(\d[ -]?){12,18}\d(?!\w)")
+
+# Keys whose values are left as-is (structured, not free text)
+_UNREDACTED_KEYS = frozenset({'timestamp', 'content_id', 'content_type', 'interaction_type', 'role', 'model'})
+
+
+def redact_text(text: str) -> str:
+    """Mask email addresses, phone numbers and card-like digit runs"""
+    text = _EMAIL.sub('[EMAIL]', text)
+    text = _LONG_NUMBER.sub('[NUMBER]', text)
+    return _PHONE.sub('[PHONE]', text)
+
+
+def pseudonymize(user_id: str, key: bytes) -> str:
+    """Stable pseudonym, so a replay still sees the same user on repeat requests"""
+    return 'user_' + hmac.new(key, user_id.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+
+def redact(value: Any, key: bytes, field: Optional[str] = None) -> Any:
+    """Copy of a JSON value with user IDs pseudonymized and free text masked"""
+    if isinstance(value, dict):
+        return {k: redact(v, key, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v, key, field) for v in value]
+    if isinstance(value, str):
+        if field == 'user_id':
+            return pseudonymize(value, key)
+        if field in _UNREDACTED_KEYS:
+            return value
+        return redact_text(value)
+    return value
+
+
+class CaptureRecord:
+    def __init__(self, endpoint: str, request: Any):
+        self.endpoint = endpoint
+        self.request = request
+        self.response: Any = None
+        self.status: Optional[int] = None
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.timings: Dict[str, float] = {}
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'timestamp': self.started,
+            'endpoint': self.endpoint,
+            'request': self.request,
+            'llm_calls': self.llm_calls,
+            'timings_ms': {name: round(s * 1000, 3) for name, s in self.timings.items()},
+            'duration_ms': round((self.duration or 0.0) * 1000, 3),
+            'status': self.status,
+            'response': self.response,
+        }
+
+
+def current_record() -> Optional[CaptureRecord]:
+    return _current.get()
+
+
+def activate(record: Optional[CaptureRecord]) -> None:
+    """Make record the target of RecordingModel in this context"""
+    _current.set(record)
+
+
+@contextmanager
+def recording(record: CaptureRecord):
+    """activate() for the duration of a block"""
+    token = _current.set(record)
+    try:
+        yield record
+    finally:
+        _current.reset(token)
+
+
+class RecordingModel:
+    """Wraps a Gemini model so prompts and outputs land in the active record"""
+
+    def __init__(self, model: Any):
+        self._model = model
+        self._name = getattr(model, 'model_name', type(model).__name__)
+
+    def generate_content(self, prompt, *args, **kwargs):
+        record = _current.get()
+        if record is None:
+            return self._model.generate_content(prompt, *args, **kwargs)
+
+        call = {'model': self._name, 'prompt': prompt}
+        start = time.perf_counter()
+        try:
+            response = self._model.generate_content(prompt, *args, **kwargs)
+            call['output'] = response.text
+            return response
+        except Exception as e:
+            call['error'] = str(e)
+            raise
+        finally:
+            call['seconds'] = round(time.perf_counter() - start, 4)
+            record.llm_calls.append(call)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+def replace_models(service: Any, wrap) -> None:
+    """
+    Replace every Gemini model held by a service
+
+    Args:
+        service: RecommendationEngine or DigitalTwinService
+        wrap: Callable mapping the original model to its replacement
+    """
+    replaced = {}
+
+    def swap(model):
+        if id(model) not in replaced:
+            replaced[id(model)] = wrap(model)
+        return replaced[id(model)]
+
+    if hasattr(service, 'model'):
+        service.model = swap(service.model)
+    for tier in getattr(service, 'tiers', {}).values():
+        tier['model'] = swap(tier['model'])
+
+
+def _writer_pid(name: str) -> Optional[int]:
+    """PID in a capture-<date>-<time>-<pid>-<n>.jsonl.gz file name"""
+    parts = name.split('-')
+    return int(parts[3]) if len(parts) == 5 and parts[3].isdigit() else None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class TrafficCapture:
+    def __init__(
+        self,
+        directory: str,
+        sample_rate: float = 0.01,
+        max_bytes: int = 50 * 1024 * 1024,
+        backups: int = 10,
+        salt: Optional[str] = None
+    ):
+        """
+        Args:
+            directory: Where capture-*.jsonl.gz files are written
+            sample_rate: Fraction of requests recorded (0-1)
+            max_bytes: Compressed size at which the current file is rotated
+            backups: Capture files kept in the directory, newest first
+            salt: Key for user ID pseudonyms (random per process when unset)
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._key = salt.encode('utf-8') if salt else os.urandom(16)
+        self._lock = threading.Lock()
+        self._raw = None
+        self._gzip = None
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+        atexit.register(self.close)
+
+    def sampled(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, endpoint: str, request: Any) -> Optional[CaptureRecord]:
+        """Start a record for this request if it is sampled"""
+        if not self.sampled():
+            return None
+        return CaptureRecord(endpoint, request)
+
+    def write(self, record: CaptureRecord) -> None:
+        """Redact and append a finished record"""
+        try:
+            line = json.dumps(redact(record.to_dict(), self._key), default=str) + '\n'
+        except (TypeError, ValueError) as e:
+            logger.error(f"Failed to serialize capture record: {str(e)}")
+            return
+
+        with self._lock:
+            try:
+                if self._gzip is None:
+                    self._open()
+                self._gzip.write(line.encode('utf-8'))
+                # Sync flush so the file stays readable while it is being written
+                self._gzip.flush()
+                self.written += 1
+                if self._raw.tell() >= self.max_bytes:
+                    self._close_file()
+            except OSError as e:
+                logger.error(f"Failed to write capture record: {str(e)}")
+                self._close_file()
+
+    def _open(self) -> None:
+        name = f"capture-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.written}.jsonl.gz"
+        self._raw = open(os.path.join(self.directory, name), 'ab')
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode='ab')
+        self._prune()
+
+    def _prune(self) -> None:
+        """
+        Keep the newest `backups` capture files in the directory
+
+        Workers share the directory, so only files nobody is still appending to
+        are deleted: this process's closed files and files of exited workers.
+        """
+        current = os.path.basename(self._raw.name) if self._raw is not None else None
+        files = []
+        for path in glob.glob(os.path.join(self.directory, 'capture-*.jsonl.gz')):
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        files.sort()
+        for _, path in files[:-self.backups] if self.backups else []:
+            name = os.path.basename(path)
+            pid = _writer_pid(name)
+            if name == current or pid is None or (pid != os.getpid() and _pid_alive(pid)):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _close_file(self) -> None:
+        try:
+            if self._gzip is not None:
+                self._gzip.close()
+            if self._raw is not None:
+                self._raw.close()
+        finally:
+            self._gzip = None
+            self._raw = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_file()
+
+
+def load_captures(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Read records from a capture file or directory, oldest file first
+
+    A file still being written (or cut off by a crash) is read up to its last
+    complete line.
+    """
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, 'capture-*.jsonl.gz')), key=os.path.getmtime)
+    else:
+        files = [path]
+
+    for file_path in files:
+        try:
+            with gzip.open(file_path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        yield json.loads(line)
+        except EOFError:
+            # Expected for the file a worker is still appending to
+            continue
+        except OSError as e:
+            logger.warning(f"Stopped reading {file_path} early: {str(e)}")
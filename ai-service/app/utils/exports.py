@@ -0,0 +1,36 @@
+"""Readers for offline table exports used to build precomputed artifacts"""
+import csv
+import json
+from typing import List, Dict, Any
+
+
+def load_records(path: str) -> List[Dict[str, Any]]:
+    """
+    Load rows from a CSV, JSON Lines, JSON array or Parquet export
+
+    Args:
+        path: Export file; the format is chosen by extension
+
+    Returns:
+        List of row dictionaries
+    """
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("pyarrow is required to read Parquet exports (uv sync --extra offline)")
+        return pq.read_table(path).to_pylist()
+
+    if path.endswith('.jsonl'):
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            rows = json.load(f)
+        if not isinstance(rows, list):
+            raise ValueError("JSON exports must contain an array of rows")
+        return rows
+
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
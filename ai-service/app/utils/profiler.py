@@ -0,0 +1,89 @@
+"""On-demand sampling profiler producing collapsed stacks for flame graphs
+
+Stacks of every other thread are sampled at a fixed interval for a fixed
+duration. Threads that are parked (waiting on a lock, a selector or a sleep)
+are skipped, so the output shows where request threads spend time. Output
+uses the collapsed format understood by flamegraph.pl and speedscope: one
+``frame;frame;frame count`` line per distinct stack.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+# Leaf functions of threads that are waiting rather than working
+_IDLE_LEAVES = frozenset({
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socketserver.py', 'serve_forever'),
+    ('queue.py', 'get'),
+    ('profiler.py', 'profile'),
+})
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, max_seconds: float = 60):
+        """
+        Args:
+            max_seconds: Longest profile that may be requested
+        """
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def profile(self, seconds: float, interval: float = 0.005, include_idle: bool = False) -> str:
+        """
+        Sample all other threads and return collapsed stacks
+
+        Args:
+            seconds: How long to sample (capped at max_seconds)
+            interval: Seconds between samples
+            include_idle: Keep stacks of threads parked in waits and sleeps
+
+        Raises:
+            ProfilerBusy: If a profile is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(min(seconds, self.max_seconds), interval, include_idle)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float, include_idle: bool) -> str:
+        me = threading.get_ident()
+        counts: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                if not include_idle and (leaf in _IDLE_LEAVES or frame.f_code.co_name == 'sleep'):
+                    continue
+                stack = []
+                current = frame
+                while current is not None:
+                    stack.append(_frame_label(current))
+                    current = current.f_back
+                stack.append(names.get(ident, 'thread'))
+                counts[';'.join(reversed(stack))] += 1
+            time.sleep(interval)
+        return '\n'.join(f"{stack} {count}" for stack, count in counts.most_common())
@@ -0,0 +1,160 @@
+"""Per-request span trees and a bounded flight recorder of recent requests
+
+A trace is started for each API request. Code on the request path wraps its
+stages in ``with span('parse'):``, which adds a timed child to the innermost
+open span. Outside a trace, span() does nothing, so services can be used
+from scripts and warm-up threads unchanged.
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'start', 'duration', 'children', 'attrs')
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.children: List['Span'] = []
+        self.attrs = attrs
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        """Span tree with offsets relative to the root, in milliseconds"""
+        origin = self.start if origin is None else origin
+        elapsed = self.duration if self.duration is not None else time.perf_counter() - self.start
+        result = {
+            'name': self.name,
+            'offset_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(elapsed * 1000, 3),
+        }
+        if self.attrs:
+            result['attrs'] = self.attrs
+        if self.children:
+            result['children'] = [child.to_dict(origin) for child in self.children]
+        return result
+
+    def totals(self) -> Dict[str, float]:
+        """Seconds spent in each descendant span name, summed"""
+        totals: Dict[str, float] = {}
+        stack = list(self.children)
+        while stack:
+            node = stack.pop()
+            if node.duration is not None:
+                totals[node.name] = totals.get(node.name, 0.0) + node.duration
+            stack.extend(node.children)
+        return totals
+
+
+class _SpanScope:
+    __slots__ = ('_name', '_attrs', '_span', '_token')
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]]):
+        self._name = name
+        self._attrs = attrs
+        self._span = None
+
+    def __enter__(self) -> Optional[Span]:
+        parent = _current.get()
+        if parent is None:
+            return None
+        self._span = Span(self._name, self._attrs)
+        parent.children.append(self._span)
+        self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if self._span is not None:
+            self._span.finish()
+            if exc_type is not None:
+                self._span.attrs = dict(self._span.attrs or {}, error=exc_type.__name__)
+            _current.reset(self._token)
+        return False
+
+
+def span(name: str, **attrs) -> _SpanScope:
+    """Time a block as a child of the current span (no-op outside a trace)"""
+    return _SpanScope(name, attrs or None)
+
+
+def start_trace(name: str, **attrs) -> Span:
+    """Open a root span and make it current in this context"""
+    root = Span(name, attrs or None)
+    _current.set(root)
+    return root
+
+
+def end_trace(root: Optional[Span]) -> None:
+    """Close a root span and clear the current span"""
+    if root is not None and root.duration is None:
+        root.finish()
+    _current.set(None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+class FlightRecorder:
+    def __init__(self, capacity: int = 200, slow_threshold: float = 2.0):
+        """
+        Keep the span trees of recent requests
+
+        Args:
+            capacity: Requests kept in each ring buffer (recent and slow)
+            slow_threshold: Seconds after which a request is logged with its span tree
+        """
+        self.slow_threshold = slow_threshold
+        self._recent: deque = deque(maxlen=capacity)
+        self._slow: deque = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.slow_count = 0
+
+    def record(self, root: Span, **info) -> None:
+        """Store a finished trace; slow ones are also logged in full"""
+        entry = (time.time(), info, root)
+        slow = root.duration >= self.slow_threshold
+        with self._lock:
+            self._recent.append(entry)
+            self.recorded += 1
+            if slow:
+                self._slow.append(entry)
+                self.slow_count += 1
+        if slow:
+            logger.warning(
+                f"Slow request {info.get('method', '')} {info.get('path', '')} took "
+                f"{root.duration * 1000:.0f}ms: {json.dumps(self._describe(entry))}"
+            )
+
+    @staticmethod
+    def _describe(entry) -> Dict[str, Any]:
+        # Span trees are only converted when someone looks at them
+        timestamp, info, root = entry
+        tree = root.to_dict()
+        return dict(info, timestamp=timestamp, duration_ms=tree['duration_ms'], spans=tree.get('children', []))
+
+    def snapshot(self, slow_only: bool = False, limit: int = 50) -> Dict[str, Any]:
+        """Newest requests first"""
+        with self._lock:
+            entries = list(self._slow if slow_only else self._recent)[-limit:]
+            recorded, slow_count = self.recorded, self.slow_count
+        return {
+            'recorded': recorded,
+            'slow': slow_count,
+            'slow_threshold_ms': round(self.slow_threshold * 1000),
+            'requests': [self._describe(entry) for entry in reversed(entries)],
+        }
@@ -0,0 +1,270 @@
+"""Schema-driven request validation that runs before any model work
+
+Schemas are plain dictionaries::
+
+    {'type': dict, 'fields': {
+        'user_id': {'type': str, 'required': True, 'min_length': 1, 'max_length': 128},
+        'limit': {'type': int, 'min': 1, 'max': 50},
+        'tags': {'type': list, 'max_items': 20, 'items': {'type': str, 'max_length': 100}},
+        'context': {'type': dict, 'nullable': True},
+    }}
+
+An explicit ``null`` is rejected like any other wrong type unless the field
+is marked ``nullable``, in which case it is treated as missing.
+
+Validation walks the payload once, checks sizes before contents so huge
+lists are rejected without iterating them, and stops after a few errors.
+"""
+from typing import Callable, List, Dict, Any
+
+
+MAX_ERRORS = 10
+
+_TYPE_NAMES = {
+    str: 'a string',
+    int: 'an integer',
+    bool: 'a boolean',
+    list: 'a list',
+    dict: 'an object',
+}
+
+
+class ValidationError(ValueError):
+    """Raised when a payload does not match its schema"""
+
+    def __init__(self, errors: List[Dict[str, str]]):
+        super().__init__(errors[0]['message'])
+        self.errors = errors
+
+
+def _format_path(parts: List[Any]) -> str:
+    path = ''
+    for part in parts:
+        if isinstance(part, int):
+            path += f"[{part}]"
+        else:
+            path = f"{path}.{part}" if path else part
+    return path
+
+
+def _error(errors: List[Dict[str, str]], parts: List[Any], message: str) -> None:
+    path = _format_path(parts)
+    errors.append({'field': path, 'message': message.format(path=path or 'Request body')})
+
+
+def _compile(schema: Dict[str, Any]) -> Callable[[Any, List[Any], List[Dict[str, str]]], None]:
+    """
+    Turn a schema into a checker closure
+
+    Constraints are resolved once here, and paths are only formatted when an
+    error is reported, so valid payloads cost a type check and a few
+    comparisons per value.
+    """
+    expected = schema['type']
+    type_error = f"{{path}} must be {_TYPE_NAMES[expected]}"
+
+    if expected is str:
+        min_length = schema.get('min_length', 0)
+        max_length = schema.get('max_length')
+        choices = schema.get('choices')
+
+        def check(value, parts, errors):
+            if type(value) is not str:
+                return _error(errors, parts, type_error)
+            if len(value) < min_length:
+                if min_length == 1:
+                    return _error(errors, parts, "{path} is required")
+                return _error(errors, parts, f"{{path}} must be at least {min_length} characters")
+            if max_length is not None and len(value) > max_length:
+                return _error(errors, parts, f"{{path}} must be {max_length} characters or less")
+            if choices is not None and value not in choices:
+                return _error(errors, parts, f"{{path}} must be one of: {', '.join(choices)}")
+
+    elif expected is int:
+        minimum = schema.get('min')
+        maximum = schema.get('max')
+
+        def check(value, parts, errors):
+            # bool is a subclass of int but never a valid count or level
+            if type(value) is not int:
+                return _error(errors, parts, type_error)
+            if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+                return _error(errors, parts, f"{{path}} must be between {minimum} and {maximum}")
+
+    elif expected is list:
+        max_items = schema.get('max_items')
+        item_check = _compile(schema['items']) if 'items' in schema else None
+
+        def check(value, parts, errors):
+            if type(value) is not list:
+                return _error(errors, parts, type_error)
+            # Size first, so oversized lists are rejected without walking them
+            if max_items is not None and len(value) > max_items:
+                return _error(errors, parts, f"{{path}} must have at most {max_items} items")
+            if item_check is not None:
+                for i, item in enumerate(value):
+                    parts.append(i)
+                    item_check(item, parts, errors)
+                    parts.pop()
+                    if len(errors) >= MAX_ERRORS:
+                        return
+
+    elif expected is dict:
+        fields = [
+            (
+                name,
+                _compile(field_schema),
+                field_schema.get('required', False),
+                field_schema.get('nullable', False)
+            )
+            for name, field_schema in schema.get('fields', {}).items()
+        ]
+
+        def check(value, parts, errors):
+            if type(value) is not dict:
+                return _error(errors, parts, type_error)
+            for name, field_check, required, nullable in fields:
+                field_value = value.get(name)
+                if field_value is None:
+                    if required:
+                        parts.append(name)
+                        _error(errors, parts, "{path} is required")
+                        parts.pop()
+                    elif name in value and not nullable:
+                        # An explicit null is a type error unless the field is nullable
+                        parts.append(name)
+                        field_check(field_value, parts, errors)
+                        parts.pop()
+                    continue
+                parts.append(name)
+                field_check(field_value, parts, errors)
+                parts.pop()
+                if len(errors) >= MAX_ERRORS:
+                    return
+
+    else:
+        def check(value, parts, errors):
+            if type(value) is not expected:
+                return _error(errors, parts, type_error)
+
+    return check
+
+
+# id(schema) -> (schema, checker); the schema is kept so its id can't be reused
+_compiled: Dict[int, tuple] = {}
+
+
+def validate(data: Any, schema: Dict[str, Any]) -> None:
+    """
+    Validate a decoded JSON payload against a schema
+
+    Raises:
+        ValidationError: With a list of {'field', 'message'} errors
+    """
+    if data is None:
+        raise ValidationError([{'field': '', 'message': 'Request body is required'}])
+
+    entry = _compiled.get(id(schema))
+    if entry is None or entry[0] is not schema:
+        entry = _compiled[id(schema)] = (schema, _compile(schema))
+    check = entry[1]
+
+    errors: List[Dict[str, str]] = []
+    check(data, [], errors)
+    if errors:
+        raise ValidationError(errors)
+
+
+# Shared building blocks
+_NAME_LIST = {'type': list, 'max_items': 50, 'items': {'type': str, 'max_length': 100}}
+_SPOOKINESS = {'type': int, 'min': 1, 'max': 5}
+_USER_ID = {'type': str, 'required': True, 'min_length': 1, 'max_length': 128}
+_CONTENT_TYPE = {'type': str, 'max_length': 50}
+
+RECOMMENDATION_REQUEST_SCHEMA = {
+    'type': dict,
+    'fields': {
+        'user_id': _USER_ID,
+        'preference_profile': {
+            'type': dict,
+            'nullable': True,
+            'fields': {
+                'favorite_ghost_types': _NAME_LIST,
+                'preferred_content_types': _NAME_LIST,
+                'cultural_interests': _NAME_LIST,
+                'spookiness_level': _SPOOKINESS,
+            }
+        },
+        'interaction_history': {
+            'type': list,
+            'nullable': True,
+            'max_items': 500,
+            'items': {
+                'type': dict,
+                'fields': {
+                    'content_id': {'type': str, 'required': True, 'min_length': 1, 'max_length': 128},
+                    'content_type': _CONTENT_TYPE,
+                    'interaction_type': {'type': str, 'max_length': 50},
+                    'timestamp': {'type': str, 'max_length': 64},
+                }
+            }
+        },
+        'limit': {'type': int, 'min': 1, 'max': 50},
+    }
+}
+
+TWIN_MESSAGE_REQUEST_SCHEMA = {
+    'type': dict,
+    'fields': {
+        'user_id': _USER_ID,
+        'message': {'type': str, 'required': True, 'min_length': 1, 'max_length': 1000},
+        'context': {
+            'type': dict,
+            'nullable': True,
+            'fields': {
+                'user_preferences': {
+                    'type': dict,
+                    'fields': {
+                        'favorite_ghost_types': _NAME_LIST,
+                        'cultural_interests': _NAME_LIST,
+                        'spookiness_level': _SPOOKINESS,
+                    }
+                },
+                'recent_messages': {
+                    'type': list,
+                    'max_items': 50,
+                    'items': {
+                        'type': dict,
+                        'fields': {
+                            'role': {'type': str, 'choices': ('user', 'assistant')},
+                            'content': {'type': str, 'max_length': 4000},
+                            'timestamp': {'type': str, 'max_length': 64},
+                        }
+                    }
+                },
+                'recent_interactions': {
+                    'type': list,
+                    'max_items': 50,
+                    'items': {
+                        'type': dict,
+                        'fields': {
+                            'content_type': _CONTENT_TYPE,
+                            'interaction_type': {'type': str, 'max_length': 50},
+                        }
+                    }
+                },
+            }
+        },
+    }
+}
+
+SIMILAR_CONTENT_REQUEST_SCHEMA = {
+    'type': dict,
+    'fields': {
+        # Either one may be sent as null when the other is set
+        'content_id': {'type': str, 'nullable': True, 'min_length': 1, 'max_length': 128},
+        'text': {'type': str, 'nullable': True, 'min_length': 1, 'max_length': 1000},
+        'limit': {'type': int, 'min': 1, 'max': 50},
+        'approximate': {'type': bool},
+    }
+}
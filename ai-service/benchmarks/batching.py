@@ -0,0 +1,145 @@
+"""Throughput and latency of personalized recommendations with and without micro-batching
+
+A local stand-in model replaces Gemini. Each call takes a fixed latency plus a
+little per user in the prompt. Calls are also throttled to a fixed number per
+second, like a provider's request-rate limit. Closed-loop clients send
+personalized requests (distinct users, so nothing is cached) for a fixed time
+at each batching window, and the benchmark reports:
+- throughput (requests/second) and p50/p95 request latency
+- model calls made and the mean batch size
+
+Usage:
+    uv run python benchmarks/batching.py [--clients 32] [--rate-limit 20] [--seconds 3]
+"""
+import argparse
+import itertools
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Nothing reaches Gemini and nothing should be cached between runs
+os.environ.setdefault('GEMINI_API_KEY', 'benchmark')
+os.environ['CACHE_DIR'] = ''
+os.environ['RECOMMENDATION_BATCH_WINDOW_MS'] = '0'
+
+from app.services.batching import MicroBatcher
+from app.services.recommendation_engine import RecommendationEngine
+
+CONTENT_TYPES = ['ghost_entity', 'story', 'movie', 'myth']
+BATCH_KEY_PATTERN = re.compile(r'User "(r\d+)" \((\d+) recommendations\)')
+SINGLE_LIMIT_PATTERN = re.compile(r'Generate (\d+) personalized recommendations')
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class StandInModel:
+    def __init__(self, latency=0.2, per_user=0.02, rate_limit=20):
+        """
+        Args:
+            latency: Seconds per call
+            per_user: Extra seconds per user in a multi-user prompt
+            rate_limit: Calls allowed per second; further calls wait for a slot
+        """
+        self.latency = latency
+        self.per_user = per_user
+        self.interval = 1.0 / rate_limit
+        self.calls = 0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _throttle(self):
+        with self._lock:
+            now = time.perf_counter()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            self.calls += 1
+        time.sleep(max(0.0, slot - time.perf_counter()))
+
+    def generate_content(self, prompt, *args, **kwargs):
+        self._throttle()
+        keys = BATCH_KEY_PATTERN.findall(prompt)
+        if keys:
+            time.sleep(self.latency + self.per_user * len(keys))
+            return _Response(json.dumps({key: self._recommendations(key, int(n)) for key, n in keys}))
+        time.sleep(self.latency)
+        return _Response(json.dumps(self._recommendations('single', int(SINGLE_LIMIT_PATTERN.search(prompt).group(1)))))
+
+    def _recommendations(self, prefix, count):
+        return [{
+            'content_id': f"{prefix}_{i}",
+            'content_type': CONTENT_TYPES[i % len(CONTENT_TYPES)],
+            'score': round(0.9 - i * 0.05, 2),
+            'reasoning': "Builds on recent interest in banshees",
+        } for i in range(count)]
+
+
+def run_load(engine, clients, seconds):
+    """Closed-loop clients sending personalized requests; returns latencies in ms and the elapsed seconds"""
+    user_ids = itertools.count()
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+    profile = {'favorite_ghost_types': ['banshee', 'yurei'], 'spookiness_level': 4}
+    history = [{'content_id': 'ghost_001', 'content_type': 'ghost_entity', 'interaction_type': 'view'}]
+
+    def client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            engine.generate_recommendations(f"user_{next(user_ids)}", profile, history, 10)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=32, help="Concurrent clients")
+    parser.add_argument('--rate-limit', type=float, default=20, help="Stand-in model calls per second")
+    parser.add_argument('--seconds', type=float, default=3, help="Load duration per window")
+    parser.add_argument('--batch-size', type=int, default=8, help="Maximum requests per batch")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Recommendation Micro-Batching Benchmark")
+    print("=" * 60)
+    print(f"Stand-in model limited to {args.rate_limit:g} calls/s")
+
+    engine = RecommendationEngine()
+    for clients in sorted({1, 4, args.clients}):
+        print(f"\n{clients} client{'s' if clients > 1 else ''}")
+        print(f"{'window':>8} | {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} | {'calls':>6} {'mean batch':>10}")
+        for window_ms in [0, 2, 5, 10, 25, 50]:
+            model = StandInModel(rate_limit=args.rate_limit)
+            engine.model = model
+            engine.cache.clear()
+            engine.batcher = None
+            if window_ms:
+                engine.batcher = MicroBatcher(engine._generate_batch, window=window_ms / 1000, max_size=args.batch_size)
+
+            latencies, elapsed = run_load(engine, clients, args.seconds)
+            latencies.sort()
+            mean_batch = engine.batcher.stats()['mean_batch_size'] if engine.batcher else 1.0
+            print(f"{window_ms:>6}ms | {len(latencies) / elapsed:>7.1f} {statistics.median(latencies):>8.1f} "
+                  f"{latencies[int(len(latencies) * 0.95)]:>8.1f} | {model.calls:>6} {mean_batch:>10.2f}")
+
+    print("\nSet RECOMMENDATION_BATCH_WINDOW_MS to the smallest window that keeps calls under the rate limit.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Measure worker cold start: time to import the app, answer readiness, and build services
+
+Each measurement runs in a fresh interpreter so nothing is already imported.
+
+Usage:
+    uv run python benchmarks/cold_start.py
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, os, time
+start = time.perf_counter()
+from app.main import create_app, recommendation_engine, digital_twin_service
+app = create_app(warm_services=False)
+imported = time.perf_counter()
+client = app.test_client()
+status = client.get('/health/ready').status_code
+ready = time.perf_counter()
+recommendation_engine.get()
+digital_twin_service.get()
+built = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'ready_ms': (ready - start) * 1000,
+    'ready_status': status,
+    'services_ms': (built - ready) * 1000,
+}))
+"""
+
+
+def main():
+    runs = 5
+    env = dict(os.environ)
+    # Readiness only needs the key to be present; no request reaches Gemini here
+    env.setdefault('GEMINI_API_KEY', 'cold-start-benchmark')
+
+    print("=" * 60)
+    print("Cold Start Benchmark")
+    print("=" * 60)
+
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-W', 'ignore', '-c', PROBE],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    for key, label in (
+        ('import_ms', 'import app + create_app'),
+        ('ready_ms', 'first /health/ready response'),
+        ('services_ms', 'first service construction'),
+    ):
+        values = [r[key] for r in results]
+        print(f"{label:<32} median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms")
+    print(f"readiness status: {results[-1]['ready_status']}")
+
+
+if __name__ == "__main__":
+    main()
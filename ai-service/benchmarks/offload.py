@@ -0,0 +1,149 @@
+"""Find where offloading CPU-bound recommendation stages starts to pay off
+
+For each stage and input size this measures:
+- call latency when the stage runs inline, on a thread pool, and on the process pool
+- latency of a small concurrent "bystander" request while the stage runs in a loop,
+  i.e. how much the stage slows down everything else in the worker by holding the GIL
+
+Offloading is worth it once the process pool's added latency is small compared to
+the time it frees up for other requests.
+
+Usage:
+    uv run python benchmarks/offload.py
+"""
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.collaborative_filter import CollaborativeFilterModel, build_item_similarity
+from app.services.offload import Offloader
+from app.services.ranking import ensure_diversity, parse_recommendations
+
+CONTENT_TYPES = ['ghost_entity', 'story', 'movie', 'myth']
+
+
+def synthetic_recommendations(count, types=2, seed=3):
+    rng = random.Random(seed)
+    return [{
+        'content_id': f"item_{i}",
+        'content_type': CONTENT_TYPES[i % types],
+        'score': round(rng.random(), 3),
+        'reasoning': "Matches the user's interest in " + ' '.join(rng.choices(['folklore', 'haunting', 'spirits', 'legend'], k=8)),
+    } for i in range(count)]
+
+
+def synthetic_cf_model(directory, items=20000, users=5000, seed=5):
+    rng = random.Random(seed)
+    interactions = [{
+        'user_id': f"user_{rng.randrange(users)}",
+        'content_id': f"item_{int(rng.paretovariate(1.2)) % items}",
+        'content_type': CONTENT_TYPES[rng.randrange(4)],
+        'interaction_type': rng.choice(['view', 'click', 'read', 'bookmark']),
+    } for _ in range(users * 20)]
+    build_item_similarity(interactions, directory, top_n=50)
+    return CollaborativeFilterModel(directory)
+
+
+def call_latency(offloader, stage, fn, args, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        offloader.run(stage, sys.maxsize, fn, *args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies)
+
+
+def bystander_p95(offloader, stage, fn, args, seconds=0.5):
+    """
+    p95 of a ~0.2ms pure-Python task while the stage runs continuously on another thread
+
+    Timed from before a 1ms sleep, so the wait to get the GIL back after waking counts.
+    """
+    stop = threading.Event()
+
+    def hog():
+        while not stop.is_set():
+            offloader.run(stage, sys.maxsize, fn, *args)
+
+    thread = threading.Thread(target=hog)
+    if fn is not None:
+        thread.start()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        time.sleep(0.001)
+        sum(i * i for i in range(2000))
+        latencies.append((time.perf_counter() - start - 0.001) * 1000)
+    stop.set()
+    if fn is not None:
+        thread.join()
+    return sorted(latencies)[int(len(latencies) * 0.95)]
+
+
+def main():
+    print("=" * 60)
+    print("Offload Crossover Benchmark")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        print("Building synthetic collaborative filtering model...")
+        cf_model = synthetic_cf_model(model_dir)
+        item_ids = [str(i) for i in cf_model.store.current()['item_ids'][:20000]]
+
+        stages = {
+            'parse': (
+                [10, 100, 1000, 10000, 50000],
+                lambda n: (parse_recommendations, (json.dumps(synthetic_recommendations(n)),)),
+                lambda n: len(json.dumps(synthetic_recommendations(n))),
+            ),
+            'diversity': (
+                [10, 1000, 10000, 100000],
+                lambda n: (ensure_diversity, (synthetic_recommendations(n),)),
+                lambda n: n,
+            ),
+            'candidates': (
+                [10, 100, 1000, 10000],
+                lambda n: (cf_model.candidates, ([{'content_id': item_ids[i % len(item_ids)], 'interaction_type': 'view'}
+                                                 for i in range(n)], 20)),
+                lambda n: n,
+            ),
+        }
+
+        # Sizes here go past what requests can reach, so start the pools regardless
+        unbounded = {stage: sys.maxsize for stage in stages}
+        backends = {
+            name: Offloader(backend=name, workers=2, max_sizes=unbounded)
+            for name in ('inline', 'thread', 'process')
+        }
+        try:
+            for stage, (sizes, make, measure_size) in stages.items():
+                print(f"\n{stage} (size = {'characters' if stage == 'parse' else 'items'})")
+                print(f"{'size':>10} | {'inline':>9} {'thread':>9} {'process':>9} (ms/call) | "
+                      f"{'bystander p95 inline':>20} {'process':>8} (ms)")
+                for n in sizes:
+                    fn, args = make(n)
+                    repeats = 20 if n <= 10000 else 5
+                    latency = {name: call_latency(o, stage, fn, args, repeats) for name, o in backends.items()}
+                    idle = bystander_p95(None, stage, None, ())
+                    inline_p95 = bystander_p95(backends['inline'], stage, fn, args)
+                    process_p95 = bystander_p95(backends['process'], stage, fn, args)
+                    print(f"{measure_size(n):>10} | {latency['inline']:>9.3f} {latency['thread']:>9.3f} "
+                          f"{latency['process']:>9.3f}           | {inline_p95:>20.3f} {process_p95:>8.3f}"
+                          f"   (idle {idle:.3f})")
+        finally:
+            for offloader in backends.values():
+                offloader.shutdown()
+
+    print("\nSet the crossover sizes with OFFLOAD_THRESHOLD_PARSE, OFFLOAD_THRESHOLD_DIVERSITY and OFFLOAD_THRESHOLD_CANDIDATES.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark exact vs approximate (IVF) similarity search: recall against latency
+
+Usage:
+    uv run python benchmarks/similarity_search.py                # synthetic catalog
+    uv run python benchmarks/similarity_search.py catalog.csv    # real export
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.similarity_index import SimilarityIndex, build_similarity_index
+from app.utils.exports import load_records
+
+
+def synthetic_catalog(size, topics=50, seed=7):
+    """Catalog whose descriptions cluster around a number of topics"""
+    rng = random.Random(seed)
+    vocabulary = [f"word{i}" for i in range(5000)]
+    topic_words = [rng.sample(vocabulary, 40) for _ in range(topics)]
+    content_types = ['ghost_entity', 'story', 'movie', 'myth']
+
+    catalog = []
+    for i in range(size):
+        topic = topic_words[rng.randrange(topics)]
+        words = rng.choices(topic, k=30) + rng.choices(vocabulary, k=15)
+        catalog.append({
+            'id': f"item_{i}",
+            'content_type': content_types[i % len(content_types)],
+            'title': f"Item {i}",
+            'description': ' '.join(words),
+        })
+    return catalog
+
+
+def percentile(values, p):
+    return sorted(values)[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def measure(index, queries, k, **kwargs):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append([row for row, _ in index.search(query, k=k, **kwargs)])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, results
+
+
+def main():
+    catalog = load_records(sys.argv[1]) if len(sys.argv) > 1 else synthetic_catalog(20000)
+    k = 10
+
+    print("=" * 60)
+    print("Similarity Search Benchmark")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        start = time.time()
+        build_similarity_index(catalog, index_dir)
+        print(f"Indexed {len(catalog)} items in {time.time() - start:.2f}s")
+
+        index = SimilarityIndex(index_dir)
+        artifact = index.store.current()
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(artifact['embeddings']), size=min(200, len(catalog)), replace=False)
+        queries = [np.asarray(artifact['embeddings'][row]) for row in rows]
+        lists = len(artifact['centroids'])
+
+        exact_latencies, exact_results = measure(index, queries, k)
+        print(f"\n{'mode':<16}{'recall@' + str(k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+        print(f"{'exact':<16}{1.0:>10.3f}{percentile(exact_latencies, 50):>10.3f}"
+              f"{percentile(exact_latencies, 99):>10.3f}")
+
+        for nprobe in (1, 2, 4, 8, 16, 32):
+            if nprobe > lists:
+                break
+            latencies, results = measure(index, queries, k, approximate=True, nprobe=nprobe)
+            recall = np.mean([
+                len(set(a) & set(e)) / max(1, len(e)) for a, e in zip(results, exact_results)
+            ])
+            print(f"{'ivf nprobe=' + str(nprobe):<16}{recall:>10.3f}{percentile(latencies, 50):>10.3f}"
+                  f"{percentile(latencies, 99):>10.3f}")
+
+        print(f"\n{lists} IVF lists, {artifact.metadata['dims']} dimensions")
+
+
+if __name__ == "__main__":
+    main()
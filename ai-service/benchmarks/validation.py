@@ -0,0 +1,96 @@
+"""Benchmark the overhead of request validation
+
+Usage:
+    uv run python benchmarks/validation.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.validation import (
+    ValidationError,
+    validate,
+    RECOMMENDATION_REQUEST_SCHEMA,
+    TWIN_MESSAGE_REQUEST_SCHEMA,
+)
+
+
+def recommendation_payload(history):
+    return {
+        "user_id": "test_user_123",
+        "preference_profile": {
+            "favorite_ghost_types": ["poltergeist", "yokai"],
+            "preferred_content_types": ["story", "ghost_entity"],
+            "cultural_interests": ["japanese", "european"],
+            "spookiness_level": 4
+        },
+        "interaction_history": [
+            {
+                "content_id": f"story_{i}",
+                "content_type": "story",
+                "interaction_type": "read",
+                "timestamp": "2024-01-01T00:00:00.000Z"
+            }
+            for i in range(history)
+        ],
+        "limit": 10
+    }
+
+
+def twin_payload(messages):
+    return {
+        "user_id": "test_user_123",
+        "message": "Tell me about Japanese ghosts",
+        "context": {
+            "user_preferences": {
+                "favorite_ghost_types": ["yokai"],
+                "cultural_interests": ["japanese"],
+                "spookiness_level": 4
+            },
+            "recent_messages": [
+                {"role": "user", "content": "x" * 200, "timestamp": "2024-01-01T00:00:00.000Z"}
+                for _ in range(messages)
+            ],
+            "recent_interactions": []
+        }
+    }
+
+
+def bench(name, payload, schema, iterations=2000):
+    body = json.dumps(payload)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        json.loads(body)
+    decode_us = (time.perf_counter() - start) / iterations * 1e6
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            validate(payload, schema)
+        except ValidationError:
+            pass
+    validate_us = (time.perf_counter() - start) / iterations * 1e6
+
+    print(f"{name:<36}{len(body):>10}{decode_us:>12.1f}{validate_us:>12.1f}")
+
+
+def main():
+    print("=" * 70)
+    print("Request Validation Benchmark")
+    print("=" * 70)
+    print(f"{'payload':<36}{'bytes':>10}{'decode us':>12}{'validate us':>12}")
+
+    bench("recommendations, empty history", recommendation_payload(0), RECOMMENDATION_REQUEST_SCHEMA)
+    bench("recommendations, 50 interactions", recommendation_payload(50), RECOMMENDATION_REQUEST_SCHEMA)
+    bench("recommendations, 500 interactions", recommendation_payload(500), RECOMMENDATION_REQUEST_SCHEMA)
+    bench("recommendations, 5000 (rejected)", recommendation_payload(5000), RECOMMENDATION_REQUEST_SCHEMA, 200)
+    bench("twin, 10 messages", twin_payload(10), TWIN_MESSAGE_REQUEST_SCHEMA)
+    bench("twin, 1000 messages (rejected)", twin_payload(1000), TWIN_MESSAGE_REQUEST_SCHEMA, 200)
+
+
+if __name__ == "__main__":
+    main()
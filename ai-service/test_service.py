@@ -20,6 +20,24 @@ def test_health_check(base_url):
         return False
 
 
+def test_liveness_and_readiness(base_url):
+    """Test the liveness and readiness endpoints"""
+    print("\nTesting liveness and readiness endpoints...")
+    try:
+        live = requests.get(f"{base_url}/health/live")
+        ready = requests.get(f"{base_url}/health/ready")
+        if live.status_code == 200 and ready.status_code == 200:
+            print("✅ Liveness and readiness passed")
+            return True
+        else:
+            print(f"❌ Liveness/readiness failed: {live.status_code}/{ready.status_code}")
+            print(f"   Response: {ready.text}")
+            return False
+    except Exception as e:
+        print(f"❌ Liveness/readiness failed: {str(e)}")
+        return False
+
+
 def test_recommendations(base_url):
     """Test the recommendations endpoint"""
     print("\nTesting recommendations endpoint...")
@@ -96,6 +114,94 @@ def test_digital_twin(base_url):
         return False
 
 
+def test_similar_content(base_url):
+    """Test the similar content endpoint"""
+    print("\nTesting similar content endpoint...")
+    
+    payload = {
+        "text": "vengeful Japanese spirits",
+        "limit": 5
+    }
+    
+    try:
+        response = requests.post(
+            f"{base_url}/ai/similar",
+            json=payload,
+            headers={"Content-Type": "application/json"}
+        )
+        
+        if response.status_code == 200:
+            data = response.json()
+            print(f"✅ Similar content endpoint passed")
+            print(f"   Received {data.get('count', 0)} items")
+            return True
+        elif response.status_code == 503:
+            print(f"✅ Similar content endpoint passed (no similarity index configured)")
+            return True
+        else:
+            print(f"❌ Similar content endpoint failed: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+    except Exception as e:
+        print(f"❌ Similar content endpoint failed: {str(e)}")
+        return False
+
+
+def test_null_limit_rejected(base_url):
+    """Test that an explicit null limit is rejected instead of reaching the services"""
+    print("\nTesting null limit validation...")
+    
+    requests_to_check = [
+        ("recommendations", {"user_id": "test_user_123", "limit": None}),
+        ("recommendations", {
+            "user_id": "test_user_123",
+            "interaction_history": [{"content_id": "ghost_001", "interaction_type": "view"}],
+            "limit": None
+        }),
+        ("similar", {"content_id": "ghost_001", "limit": None}),
+    ]
+    
+    try:
+        for endpoint, payload in requests_to_check:
+            response = requests.post(
+                f"{base_url}/ai/{endpoint}",
+                json=payload,
+                headers={"Content-Type": "application/json"}
+            )
+            # /ai/similar answers 503 before validating when no index is configured
+            if response.status_code == 400 or (endpoint == "similar" and response.status_code == 503):
+                continue
+            print(f"❌ Null limit validation failed for /ai/{endpoint}: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+        print("✅ Null limit validation passed")
+        return True
+    except Exception as e:
+        print(f"❌ Null limit validation failed: {str(e)}")
+        return False
+
+
+def test_malformed_body_rejected(base_url):
+    """Test that a body that isn't JSON is reported as such, not as missing"""
+    print("\nTesting malformed body validation...")
+    
+    try:
+        response = requests.post(
+            f"{base_url}/ai/twin/message",
+            data='{"user_id": "test_user_123", "message":',
+            headers={"Content-Type": "application/json"}
+        )
+        if response.status_code == 400 and response.json().get("error") == "Request body must be valid JSON":
+            print("✅ Malformed body validation passed")
+            return True
+        print(f"❌ Malformed body validation failed: {response.status_code}")
+        print(f"   Response: {response.text}")
+        return False
+    except Exception as e:
+        print(f"❌ Malformed body validation failed: {str(e)}")
+        return False
+
+
 def main():
     base_url = "http://localhost:5001"
     
@@ -107,8 +213,12 @@ def main():
     
     results = []
     results.append(test_health_check(base_url))
+    results.append(test_liveness_and_readiness(base_url))
     results.append(test_recommendations(base_url))
     results.append(test_digital_twin(base_url))
+    results.append(test_similar_content(base_url))
+    results.append(test_null_limit_rejected(base_url))
+    results.append(test_malformed_body_rejected(base_url))
     
     print("\n" + "=" * 60)
     passed = sum(results)